@@ -0,0 +1,263 @@
+import functools
+
+from flask import request, jsonify, url_for
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+from app import app, db
+from models import Photos, todo, Contact, User
+from pagination import keyset_page, valid_id
+from uploads import check_csrf
+
+# JSON API for the mobile app, at /api/v1/...
+#   GET  /api/v1/me                       the logged in user, and the csrf token to send with changes
+#   GET  /api/v1/photos[/<id>]            photos in the gallery (administrators see every photo)
+#   GET  /api/v1/todos[/<id>]             the user's to do items
+#   POST /api/v1/todos/batch              creates, updates and deletes many to do items at once
+#   GET  /api/v1/messages[/<id>]          contact messages (administrators only)
+#   GET  /api/v1/users[/<id>]             users (administrators only)
+# Lists come a page at a time: {"data": [...], "next": cursor, "prev": cursor}, pass ?after=<next>
+# (or ?before=<prev>) for the next page and ?limit= for the page size. ?fields=id,title only returns
+# those fields. Every response has an ETag, so a client sending If-None-Match gets an empty 304 if
+# nothing has changed. The API uses the same login session as the website, and requests that change
+# anything need the X-CSRFToken header (like the upload api).
+
+API_MAX_LIMIT = 100
+BATCH_MAX_OPERATIONS = 100
+
+
+# fields each kind of row can be returned with
+PHOTO_FIELDS = {
+    'id': lambda photo: photo.photoid,
+    'title': lambda photo: photo.title,
+    'userid': lambda photo: photo.userid,
+    'dateSubmitted': lambda photo: photo.dateSubmitted.isoformat() if photo.dateSubmitted else None,
+    'enabled': lambda photo: bool(photo.enabled),
+    'status': lambda photo: photo.status,
+    'width': lambda photo: photo.width,
+    'height': lambda photo: photo.height,
+    'url': lambda photo: photo.medium_url(),
+    'thumb': lambda photo: photo.thumb_url(),
+    'srcset': lambda photo: photo.srcset(),
+    'page': lambda photo: url_for('photo_display', photo_id=photo.photoid),
+}
+TODO_FIELDS = {
+    'id': lambda item: item.id,
+    'text': lambda item: item.text,
+    'done': lambda item: bool(item.done),
+}
+MESSAGE_FIELDS = {
+    'id': lambda contact: contact.id,
+    'name': lambda contact: contact.name,
+    'email': lambda contact: contact.email,
+    'message': lambda contact: contact.message,
+    'dateSubmitted': lambda contact: contact.dateSubmitted.isoformat() if contact.dateSubmitted else None,
+}
+USER_FIELDS = {
+    'id': lambda user: user.id,
+    'name': lambda user: user.name,
+    'email_address': lambda user: user.email_address,
+    'user_level': lambda user: user.user_level,
+    'active': lambda user: bool(user.active),
+}
+
+
+# an error response: {"error": message}
+def api_error(message, status):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+
+# the api answers with a 401 error instead of redirecting to the login page
+def api_login_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_user.is_anonymous:
+            return api_error("You need to log in", 401)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def api_admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_user.is_anonymous:
+            return api_error("You need to log in", 401)
+        if not current_user.is_admin():
+            return api_error("You must be an administrator", 403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# json response with an ETag made from its contents, or an empty 304 if the client already has it
+def conditional_json(data):
+    response = jsonify(data)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # may be kept, but must be checked with If-None-Match before use
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+# the fields asked for with ?fields=, or None if one of them doesn't exist
+def requested_fields(fields):
+    if not request.args.get('fields'):
+        return list(fields)
+    names = [name.strip() for name in request.args['fields'].split(',') if name.strip()]
+    return names if all(name in fields for name in names) else None
+
+
+# one row as a dict of the requested fields
+def serialize(row, fields, names):
+    return {name: fields[name](row) for name in names}
+
+
+# a page of rows, sorted by id, as a json response
+def list_response(query, id_column, fields):
+    names = requested_fields(fields)
+    if names is None:
+        return api_error("Unknown field, choose from: " + ", ".join(fields), 400)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), API_MAX_LIMIT)
+    page = keyset_page(query, id_column, id_column, limit, after=request.args.get('after'),
+                       before=request.args.get('before'), descending=request.args.get('order') == 'desc')
+    return conditional_json({'data': [serialize(row, fields, names) for row in page.items],
+                             'next': page.next_cursor, 'prev': page.prev_cursor})
+
+
+# one row as a json response
+def item_response(row, fields):
+    if row is None:
+        return api_error("Not found", 404)
+    names = requested_fields(fields)
+    if names is None:
+        return api_error("Unknown field, choose from: " + ", ".join(fields), 400)
+    return conditional_json({'data': serialize(row, fields, names)})
+
+
+# photos the current user can see through the api
+def visible_photos():
+    query = Photos.query
+    if current_user.is_anonymous or not current_user.is_admin():
+        query = query.filter(Photos.enabled == True, Photos.status == 'ready')
+    return query
+
+
+@app.route('/api/v1/me')
+@api_login_required
+def api_me():
+    return jsonify(data=serialize(current_user, USER_FIELDS, list(USER_FIELDS)), csrf_token=generate_csrf())
+
+
+@app.route('/api/v1/photos')
+def api_photos():
+    query = visible_photos()
+    if request.args.get('userid', type=int) is not None:  # one user's album
+        query = query.filter(Photos.userid == request.args.get('userid', type=int))
+    return list_response(query, Photos.photoid, PHOTO_FIELDS)
+
+
+@app.route('/api/v1/photos/<int:photo_id>')
+def api_photo(photo_id):
+    return item_response(visible_photos().filter(Photos.photoid == photo_id).first(), PHOTO_FIELDS)
+
+
+@app.route('/api/v1/todos')
+@api_login_required
+def api_todos():
+    return list_response(todo.query.filter(todo.user_id == current_user.id), todo.id, TODO_FIELDS)
+
+
+@app.route('/api/v1/todos/<int:todo_id>')
+@api_login_required
+def api_todo(todo_id):
+    return item_response(todo.query.filter(todo.id == todo_id, todo.user_id == current_user.id).first(), TODO_FIELDS)
+
+
+# applies a list of to do changes in one transaction, either all of them happen or none do
+#   {"operations": [{"op": "create", "text": "...", "done": false},
+#                   {"op": "update", "id": 3, "text": "...", "done": true},   (text and done are optional)
+#                   {"op": "delete", "id": 4}]}
+# -> {"data": [the created / updated item, or {"id": ..., "deleted": true}, one for each operation]}
+@app.route('/api/v1/todos/batch', methods=['POST'])
+@api_login_required
+def api_todos_batch():
+    check_csrf()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return api_error("Send a JSON object", 400)
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return api_error("Send a list of operations", 400)
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return api_error("At most {} operations can be sent at once".format(BATCH_MAX_OPERATIONS), 413)
+
+    # every item being changed is loaded in one query
+    ids = {operation.get('id') for operation in operations
+           if isinstance(operation, dict) and valid_id(operation.get('id'))}
+    items = {item.id: item for item in todo.query.filter(todo.user_id == current_user.id, todo.id.in_(ids))}
+    results = []
+    for index, operation in enumerate(operations):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        text = operation.get('text') if op else None
+        if text is not None and (not isinstance(text, str) or not text.strip()):
+            db.session.rollback()
+            return api_error("Operation {}: text can't be empty".format(index), 400)
+        if op and 'done' in operation and not isinstance(operation['done'], bool):
+            db.session.rollback()
+            return api_error("Operation {}: done must be true or false".format(index), 400)
+        if op in ('update', 'delete') and not valid_id(operation.get('id')):
+            db.session.rollback()
+            return api_error("Operation {}: id must be a number".format(index), 400)
+        if op == 'create':
+            if text is None:
+                db.session.rollback()
+                return api_error("Operation {}: text is needed".format(index), 400)
+            item = todo(text=text, user_id=current_user.id, done=operation.get('done', False))
+            db.session.add(item)
+            results.append(item)
+        elif op in ('update', 'delete'):
+            item = items.get(operation.get('id'))
+            if item is None:
+                db.session.rollback()
+                return api_error("Operation {}: to do item {} not found".format(index, operation.get('id')), 404)
+            if op == 'delete':
+                db.session.delete(item)
+                del items[item.id]  # so a later operation can't change it
+                results.append({'id': item.id, 'deleted': True})
+            else:
+                if text is not None:
+                    item.text = text
+                if 'done' in operation:
+                    item.done = operation['done']
+                results.append(item)
+        else:
+            db.session.rollback()
+            return api_error("Operation {}: op must be create, update or delete".format(index), 400)
+    db.session.flush()  # gives the new items their ids
+    data = [result if isinstance(result, dict) else serialize(result, TODO_FIELDS, list(TODO_FIELDS)) for result in results]
+    db.session.commit()  # one commit for the whole batch
+    return jsonify(data=data)
+
+
+@app.route('/api/v1/messages')
+@api_admin_required
+def api_messages():
+    return list_response(Contact.query, Contact.id, MESSAGE_FIELDS)
+
+
+@app.route('/api/v1/messages/<int:message_id>')
+@api_admin_required
+def api_message(message_id):
+    return item_response(db.session.get(Contact, message_id), MESSAGE_FIELDS)
+
+
+@app.route('/api/v1/users')
+@api_admin_required
+def api_users():
+    return list_response(User.query, User.id, USER_FIELDS)
+
+
+@app.route('/api/v1/users/<int:userid>')
+@api_admin_required
+def api_user(userid):
+    return item_response(db.session.get(User, userid), USER_FIELDS)
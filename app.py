@@ -1,40 +1,99 @@
+# development server (python app.py), use wsgi.py in production
+# the other modules import this file as "app", which is a different copy to the one python runs as
+# __main__, so the server is started with the imported copy before this one sets anything up
+if __name__ == '__main__':
+    from app import app
+    app.run()
+    raise SystemExit
+
 from flask import Flask, render_template, request, redirect, url_for, flash
-from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 
 from config import Config
+from database import setup_engine
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 from flask_login import current_user, login_user, LoginManager, logout_user, login_required
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 import os
+import uuid
 
 app = Flask(__name__)
 app.config.from_object(Config)  # loads the configuration for the database
 db = SQLAlchemy(app)  # creates the db object using the configuration
+setup_engine(app, db)  # sqlite pragmas (see database.py)
+migrate = Migrate(app, db, render_as_batch=True)  # database migrations (flask db upgrade)
 login = LoginManager(app)
 login.login_view = 'login'
+if app.config['TRUSTED_PROXIES']:  # behind a load balancer, so the client's address comes from X-Forwarded-For
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
 
 # Information for uploaded images
 UPLOAD_FOLDER = './static/images/userPhotos/'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+
+# used for checking that an attached file is the correct filetype
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
 # these imports must be after (db = SQLAlchemy(app))
-from models import Contact, todo, User, Photos
-from forms import ContactForm, RegistrationForm, LoginForm, ResetPasswordForm, ResetPasswordFormAdmin, PhotoUploadForm, TodoForm
+from models import Contact, todo, User, Photos, forget_user
+from forms import ContactForm, RegistrationForm, LoginForm, ResetPasswordForm, ResetPasswordFormAdmin, PhotoUploadForm, TodoForm, BulkActionForm
+from images import build_variants
+from storage import delete_photo, release, INCOMING_FOLDER
+from uploads import add_photo, quota_left
+import assets  # static file serving and asset_url() for templates
+from cache import cache, cached_page
+import metrics  # request timing, Server-Timing header and /admin/metrics
+from pagination import keyset_page, id_arg, valid_id
+import search  # full text search, /search and /api/search
+import api  # json api for the mobile app (/api/v1/...)
+import health  # /health and /ready for load balancers
+from ratelimit import login_wait
+from sessions import end_user_sessions
+from warmup import warm_up
+
+# columns the admin lists can be sorted by (?sort=...), and the actions that can be applied to ticked rows
+MESSAGE_SORTS = {'date': Contact.dateSubmitted, 'name': Contact.name, 'email': Contact.email}
+USER_SORTS = {'id': User.id, 'name': User.name, 'email': User.email_address}
+PHOTO_SORTS = {'id': Photos.photoid, 'date': Photos.dateSubmitted, 'title': Photos.title}
+MESSAGE_ACTIONS = [('delete', 'Delete')]
+USER_ACTIONS = [('enable', 'Enable'), ('disable', 'Disable')]
+PHOTO_ACTIONS = [('enable', 'Enable'), ('disable', 'Disable'), ('delete', 'Delete')]
+
+
+# the search text, sort column name and direction chosen for an admin list
+def list_options(sorts, default_sort, default_descending=False):
+    sort = request.args.get('sort')
+    if sort not in sorts:
+        sort = default_sort
+    descending = request.args.get('order', 'desc' if default_descending else 'asc') == 'desc'
+    return request.args.get('q', '').strip(), sort, descending
+
+
+# a bulk action form with the given choices, and the ids of the ticked rows
+def bulk_action_form(choices):
+    form = BulkActionForm()
+    form.action.choices = choices
+    return form, request.form.getlist('ids', type=int)
 
 
 # Index / Home page
 @app.route('/')
+@cached_page('pages')
 def homepage():
     return render_template("index.html", title="Home Page", user=current_user)
 
 
-if __name__ == '__main__':
-    app.run()
-
-
 # History Page
 @app.route('/history')
+@cached_page('pages')
 def history():
     return render_template("history.html", title="History", user=current_user)
 
@@ -58,19 +117,42 @@ def contact():
 @login_required
 def contact_messages():
     if current_user.is_admin():  # checks if the user is an admin
-        all_messages = db.session.query(Contact).all()  # gets all messages from contact table
-        all_messages_count = Contact.query.count()  # gets count of all messages in database
+        search_text, sort, descending = list_options(MESSAGE_SORTS, 'date', default_descending=True)  # newest first
+        query = Contact.query
+        if search_text:
+            query = query.filter(or_(Contact.name.contains(search_text, autoescape=True),
+                                     Contact.email.contains(search_text, autoescape=True),
+                                     Contact.message.contains(search_text, autoescape=True)))
+        page = keyset_page(query, MESSAGE_SORTS[sort], Contact.id, app.config['ADMIN_PAGE_SIZE'],
+                           after=request.args.get('after'), before=request.args.get('before'), descending=descending)
+        form, _ = bulk_action_form(MESSAGE_ACTIONS)
         return render_template("contact_messages.html", title="Contact Messages", user=current_user,
-                               messages=all_messages, messages_count=all_messages_count)
+                               messages=page.items, messages_count=query.count(), page=page, form=form,
+                               search=search_text, sort=sort, descending=descending)
     else:
         return redirect(url_for('homepage'))  # if user is not an admin user gets redirected to home page
 
 
+# delete the ticked messages (administrator only)
+@app.route('/admin/messages_bulk', methods=['POST'])
+@login_required
+def messages_bulk():
+    if not current_user.is_admin():  # checks if user is not an admin
+        flash("You must be an administrator to access this page")
+        return redirect(url_for('homepage'))
+    form, ids = bulk_action_form(MESSAGE_ACTIONS)
+    if form.validate_on_submit() and ids:
+        count = Contact.query.filter(Contact.id.in_(ids)).delete(synchronize_session=False)  # one DELETE for every message
+        db.session.commit()
+        flash("{} messages deleted".format(count))
+    return redirect(url_for('contact_messages', **request.args))  # back to the same page of the list
+
+
 # admin message delete
 @app.route("/admin/messagedeleteadmin/<message_id>", methods=['GET', 'POST'])
 @login_required
 def message_delete_admin(message_id):
-    if not current_user.is_admin:  # if user is not an admin
+    if not current_user.is_admin():  # if user is not an admin
         flash("You need to be an admin to do this!")
         return redirect(url_for('homepage'))
     if request.method == "GET":  # if the form is submitted with GET method (trying to access something in the db)
@@ -85,14 +167,42 @@ def message_delete_admin(message_id):
 @login_required
 def list_all_users():
     if current_user.is_admin():  # checks if the user is an admin
-        all_users = User.query.all()  # gets all users in the database
-        all_users_count = User.query.count()  # gets count of all users in database
-        return render_template("listAllUsers.html", title="All Users", user=current_user, users=all_users, users_count=all_users_count)
+        search_text, sort, descending = list_options(USER_SORTS, 'id')
+        query = User.query
+        if search_text:
+            query = query.filter(or_(User.name.contains(search_text, autoescape=True),
+                                     User.email_address.contains(search_text, autoescape=True)))
+        page = keyset_page(query, USER_SORTS[sort], User.id, app.config['ADMIN_PAGE_SIZE'],
+                           after=request.args.get('after'), before=request.args.get('before'), descending=descending)
+        form, _ = bulk_action_form(USER_ACTIONS)
+        return render_template("listAllUsers.html", title="All Users", user=current_user, users=page.items,
+                               users_count=query.count(), page=page, form=form,
+                               search=search_text, sort=sort, descending=descending)
     else:  # if user is not an admin
         flash("You must be an administrator to access this page")
         return redirect(url_for("homepage"))
 
 
+# enable / disable the ticked users (administrator only)
+@app.route('/admin/users_bulk', methods=['POST'])
+@login_required
+def users_bulk():
+    if not current_user.is_admin():  # checks if user is not an admin
+        flash("You must be an administrator to access this page")
+        return redirect(url_for('homepage'))
+    form, ids = bulk_action_form(USER_ACTIONS)
+    if form.validate_on_submit() and ids:
+        active = form.action.data == 'enable'
+        count = User.query.filter(User.id.in_(ids)).update({User.active: active}, synchronize_session=False)  # one UPDATE
+        db.session.commit()
+        for userid in ids:
+            forget_user(userid)
+            if not active:
+                end_user_sessions(userid)  # logs them out everywhere
+        flash("{} users {}".format(count, "enabled" if active else "disabled"))
+    return redirect(url_for('list_all_users', **request.args))  # back to the same page of the list
+
+
 # reset user passwords (administrators only)
 @app.route('/reset_password_admin/<userid>', methods=['GET', 'POST'])
 @login_required
@@ -105,6 +215,7 @@ def reset_user_password(userid):
     if form.validate_on_submit():  # if user is admin
         user_to_reset.set_password(form.new_password.data)  # sets new password
         db.session.commit()
+        forget_user(user_to_reset.id)  # the cached copy of the user is out of date
         flash('Password has been reset for user {}'.format(user_to_reset.name))  # message to admin
         return redirect(url_for('homepage'))
     return render_template("passwordResetAdmin.html", title='Reset User Password', form=form, user=current_user, user_to_reset=user_to_reset)
@@ -116,22 +227,24 @@ def reset_user_password(userid):
 def photos():
     form = PhotoUploadForm()
     user_images = Photos.query.filter_by(userid=current_user.id).all()  # gets all images from database that current user has submitted
-    user_images_count = Photos.query.filter_by(userid=current_user.id).count()  # gets the could of all images he user has uploaded
+    user_images_count = len(user_images)  # counts the images already loaded instead of querying again
     if form.validate_on_submit():  # if the form is properly filled out
         new_image = form.image.data  # gets file name
         filename = secure_filename(new_image.filename)  # stores filename as a secure filename
 
         if new_image and allowed_file(filename):  # checks if the file is an allowed filetype
             file_ext = filename.split(".")[1]  # Get the file extension of the file
-            import uuid
             random_filename = str(uuid.uuid4())  # creates a random file name using the uuid library
-            filename = random_filename + "." + file_ext  # overrides the file name with the randomly generated one
-            new_image.save(os.path.join(UPLOAD_FOLDER, filename))  # uploads the file to the userPhotos folder
-            photo = Photos(title=form.title.data, filename=filename,
-                           userid=current_user.id, enabled=1)  # creates a new photo model
-            db.session.add(photo)  # adds photo information into the database
-            db.session.commit()  # commits new data to database
-            flash("Image uploaded to the photo gallery!")  # message to display to user
+            filename = INCOMING_FOLDER + "/" + random_filename + "." + file_ext  # overrides the file name with the randomly generated one
+            os.makedirs(os.path.join(UPLOAD_FOLDER, INCOMING_FOLDER), exist_ok=True)
+            new_image.save(os.path.join(UPLOAD_FOLDER, filename))  # uploads the file to the incoming folder until it is processed
+            size = os.path.getsize(os.path.join(UPLOAD_FOLDER, filename))
+            if size > quota_left(current_user.id):  # the user has used up their space
+                os.remove(os.path.join(UPLOAD_FOLDER, filename))
+                flash("You don't have enough space left for this image")
+                return redirect(url_for("photos"))
+            add_photo(form.title.data, filename, current_user.id, size)  # adds the photo and queues it to be processed (uploads.py)
+            flash("Image uploaded! It will appear in the photo gallery once it has been processed")  # message to display to user
             return redirect(url_for("photos"))
         else:  # if filetype not allowed
             flash("The file upload failed")  # display error message to user
@@ -143,8 +256,13 @@ def photos():
 @login_required
 def photo_delete(photo_id):
     if request.method == "GET":  # if the form is submitted with GET method (trying to access something in the db)
-        db.session.query(Photos).filter_by(photoid=photo_id).delete()  # finds entry in db with matching id to photo_id and removes it
-        db.session.commit()  # commits any changes to db
+        photo = Photos.query.filter_by(photoid=photo_id).first()  # finds entry in db with matching id to photo_id
+        if photo is not None and photo.userid != current_user.id:  # users can only delete their own photos
+            flash("You can only delete your own photos")
+            return redirect("/userPhotos")
+        if photo is not None:
+            delete_photo(photo)  # removes it, and its file if no other photo uses the same image
+            cache.invalidate('gallery', 'photo:' + str(photo_id))  # the gallery needs to be rendered again
         flash("Image successfully deleted!")
     return redirect("/userPhotos")
 
@@ -153,32 +271,80 @@ def photo_delete(photo_id):
 @app.route("/admin/photodeleteadmin/<photo_id>", methods=['GET', 'POST'])
 @login_required
 def photo_delete_admin(photo_id):
-    if not current_user.is_admin:  # if user is not an admin
+    if not current_user.is_admin():  # if user is not an admin
         flash("You need to be an admin to do this!")
         return redirect(url_for('homepage'))
     if request.method == "GET":  # if the form is submitted with GET method (trying to access something in the db)
-        db.session.query(Photos).filter_by(photoid=photo_id).delete()  # finds entry in db with matching id to photo_id and removes it
-        db.session.commit()  # commits any changes to db
+        photo = Photos.query.filter_by(photoid=photo_id).first()  # finds entry in db with matching id to photo_id
+        if photo is not None:
+            delete_photo(photo)  # removes it, and its file if no other photo uses the same image
+            cache.invalidate('gallery', 'photo:' + str(photo_id))  # the gallery needs to be rendered again
         flash("Image successfully deleted!")
     return redirect(url_for('list_all_photos'))
 
 
+# the next (or previous) photo shown in the gallery, optionally only from one user's photos
+# deleted, disabled and unprocessed photos are skipped in the same indexed query
+def neighbour_photo(photoid, newer, userid=None):
+    query = Photos.query.filter(Photos.enabled == True, Photos.status == 'ready')
+    if userid is not None:
+        query = query.filter(Photos.userid == userid)
+    if newer:
+        return query.filter(Photos.photoid > photoid).order_by(Photos.photoid).first()
+    return query.filter(Photos.photoid < photoid).order_by(Photos.photoid.desc()).first()
+
+
+# url of the copy of a photo the browser will want for the photo page, in the best format it says it accepts
+def display_image_url(photo):
+    accepted = list(request.accept_mimetypes.values())
+    for ext in photo.format_list():  # best first (e.g. avif then webp)
+        if 'image/' + ext in accepted:
+            return photo.medium_url(ext)
+    return photo.medium_url()
+
+
 # view single image
-@app.route('/userPhotos/<photo_id>')
+@app.route('/userPhotos/<int:photo_id>')
 @login_required
 def photo_display(photo_id):
-    image = Photos.query.filter_by(photoid=photo_id).all()  # gets image by the photo id in the URL
-    max_image = db.session.query(func.max(Photos.photoid)).scalar()  # gets max value of photo id as a readable int (scalar)
-    all_users = User.query.all()  # gets all users
-    return render_template("photoDisplay.html", user=current_user, photo=image, max_photo=max_image, title="View Image", users=all_users)
-
-
-# photo gallery to display all images
+    image = db.session.get(Photos, photo_id) if valid_id(photo_id) else None  # gets image by the photo id in the URL
+    album = request.args.get('album', type=id_arg)  # only step through this user's photos
+    previous_image = next_image = None
+    if image is not None and image.enabled and image.status == 'ready':
+        previous_image = neighbour_photo(photo_id, newer=False, userid=album)
+        next_image = neighbour_photo(photo_id, newer=True, userid=album)
+    # the browser fetches the next page and its image while this one is being looked at
+    prefetch = [url_for('photo_display', photo_id=next_image.photoid, album=album), display_image_url(next_image)] \
+        if next_image is not None else []
+    return render_template("photoDisplay.html", user=current_user, image=image, previous_image=previous_image,
+                           next_image=next_image, album=album, prefetch=prefetch, title="View Image")
+
+
+# photo gallery to display all images (one page at a time)
 @app.route('/gallery')
+@cached_page('gallery', args={'after': id_arg, 'before': id_arg})
 def photo_gallery():
-    all_images = Photos.query.all()  # gets all photos
-    all_users = User.query.all()  # gets all users
-    return render_template("gallery.html", title="Photo Gallery", user=current_user, images=all_images, users=all_users)
+    page_size = app.config['GALLERY_PAGE_SIZE']
+    after = request.args.get('after', type=id_arg)  # last photo id on the previous page (ignored if out of range)
+    before = request.args.get('before', type=id_arg)  # first photo id on the next page
+    query = db.session.query(Photos, User.name).outerjoin(User, User.id == Photos.userid) \
+        .filter(Photos.enabled == True, Photos.status == 'ready')  # only enabled, processed photos, with the uploader name joined in
+    if before is not None:  # going backwards, so read the page in reverse then flip it
+        page = query.filter(Photos.photoid < before).order_by(Photos.photoid.desc()).limit(page_size + 1).all()
+        has_more = len(page) > page_size
+        page = page[:page_size][::-1]
+        prev_cursor = page[0][0].photoid if has_more else None
+        next_cursor = page[-1][0].photoid if page else None
+    else:
+        if after is not None:
+            query = query.filter(Photos.photoid > after)
+        page = query.order_by(Photos.photoid).limit(page_size + 1).all()  # one extra row tells us if there is a next page
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        prev_cursor = page[0][0].photoid if after is not None and page else None
+        next_cursor = page[-1][0].photoid if has_more else None
+    return render_template("gallery.html", title="Photo Gallery", user=current_user, images=page,
+                           prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 
 # List all photos (administrator only)
@@ -186,15 +352,52 @@ def photo_gallery():
 @login_required
 def list_all_photos():
     if current_user.is_admin():  # checks if the user is an admin
-        all_photos = Photos.query.all()  # gets all photos in the database
-        all_photos_count = Photos.query.count()  # gets count of all photos in database
-        all_users = User.query.all()  # gets all users in the database
-        return render_template("listAllPhotos.html", title="All Photos", user=current_user, photos=all_photos, photos_count=all_photos_count, users=all_users)
+        search_text, sort, descending = list_options(PHOTO_SORTS, 'id')
+        status = request.args.get('status', '')
+        query = db.session.query(Photos, User.name).outerjoin(User, User.id == Photos.userid)  # uploader name joined in
+        if search_text:
+            query = query.filter(Photos.title.contains(search_text, autoescape=True))
+        if status == 'enabled' or status == 'disabled':
+            query = query.filter(Photos.status == 'ready', Photos.enabled == (status == 'enabled'))
+        elif status:
+            query = query.filter(Photos.status == status)
+        page = keyset_page(query, PHOTO_SORTS[sort], Photos.photoid, app.config['ADMIN_PAGE_SIZE'],
+                           after=request.args.get('after'), before=request.args.get('before'), descending=descending)
+        form, _ = bulk_action_form(PHOTO_ACTIONS)
+        return render_template("listAllPhotos.html", title="All Photos", user=current_user, photos=page.items,
+                               photos_count=query.count(), page=page, form=form,
+                               search=search_text, sort=sort, descending=descending, status=status)
     else:  # if user is not an admin
         flash("You must be an administrator to access this page")
         return redirect(url_for("homepage"))
 
 
+# enable / disable / delete the ticked photos (administrator only)
+@app.route('/admin/photos_bulk', methods=['POST'])
+@login_required
+def photos_bulk():
+    if not current_user.is_admin():  # checks if user is not an admin
+        flash("You must be an administrator to access this page")
+        return redirect(url_for('homepage'))
+    form, ids = bulk_action_form(PHOTO_ACTIONS)
+    if form.validate_on_submit() and ids:
+        selected = Photos.query.filter(Photos.photoid.in_(ids))
+        if form.action.data == 'delete':
+            filenames = {filename for filename, in selected.with_entities(Photos.filename)}
+            count = selected.delete(synchronize_session=False)  # one DELETE for every photo
+            db.session.commit()
+            for filename in filenames:
+                release(filename)  # deletes the files no other photo uses
+            flash("{} photos deleted".format(count))
+        else:
+            enabled = form.action.data == 'enable'
+            count = selected.update({Photos.enabled: enabled}, synchronize_session=False)  # one UPDATE
+            db.session.commit()
+            flash("{} photos {}".format(count, "enabled" if enabled else "disabled"))
+        cache.invalidate('gallery', *['photo:' + str(photoid) for photoid in ids])  # the gallery needs to be rendered again
+    return redirect(url_for('list_all_photos', **request.args))  # back to the same page of the list
+
+
 # enable / disable image
 @app.route('/admin/photo_enable_disable/<photo_id>')
 @login_required
@@ -205,13 +408,43 @@ def photo_enable_disable(photo_id):
     photo = Photos.query.filter_by(photoid=photo_id).first()  # finds user selected
     photo.enabled = not photo.enabled  # switches boolean value in table
     db.session.commit()
+    cache.invalidate('gallery', 'photo:' + str(photo.photoid))  # the gallery needs to be rendered again
     return redirect(url_for("list_all_photos"))
 
 
-# used for checking that an attached file is the correct filetype
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# page cache hit / miss counts (administrator only)
+@app.route('/admin/cache')
+@login_required
+def cache_stats():
+    if not current_user.is_admin():  # checks if user is not an admin
+        flash("You must be an administrator to access this page")
+        return redirect(url_for('homepage'))
+    return render_template("cacheStats.html", title="Page Cache", user=current_user, cache=cache,
+                           cache_type=app.config['CACHE_TYPE'])
+
+
+# empties the page cache (administrator only)
+@app.route('/admin/cache_clear')
+@login_required
+def cache_clear():
+    if not current_user.is_admin():  # checks if user is not an admin
+        flash("You must be an administrator to access this page")
+        return redirect(url_for('homepage'))
+    cache.clear()
+    flash("Page cache cleared")
+    return redirect(url_for("cache_stats"))
+
+
+# makes resized copies for photos uploaded before they were created on upload (flask --app app build-variants)
+@app.cli.command("build-variants")
+def build_missing_variants():
+    for photo in Photos.query.filter(Photos.thumb == None).all():  # photos without resized copies
+        if not os.path.exists(os.path.join(UPLOAD_FOLDER, photo.filename)):
+            print("Missing file for photo {}: {}".format(photo.photoid, photo.filename))
+            continue
+        photo.set_variants(build_variants(UPLOAD_FOLDER, photo.filename))
+        db.session.commit()
+        print("Built variants for photo {}".format(photo.photoid))
 
 
 # To do page
@@ -261,7 +494,13 @@ def register():
                         user_level=1, active=1)  # defaults to regular user
         new_user.set_password(form.password.data)  # sets password
         db.session.add(new_user)  # saves to database
-        db.session.commit()  # commits to database
+        try:
+            db.session.commit()  # commits to database
+        except IntegrityError:  # someone registered the same email address at the same moment
+            db.session.rollback()
+            form.email_address.errors.append("Please Use a Different Email Address")
+            return render_template("registration.html", title="Register Account", form=form, user=current_user)
+        forget_user(new_user.id)  # in case the id was looked up (and not found) while cached
         flash("Account successfully created")  # display a flash message
         return redirect(url_for("login"))  # redirects user to login page
     return render_template("registration.html", title="Register Account", form=form, user=current_user)
@@ -272,16 +511,24 @@ def register():
 def login():
     form = LoginForm()
     if form.validate_on_submit():  # if form is valid
+        wait = login_wait(request.remote_addr, form.email_address.data)  # too many attempts from this address or for this account
+        if wait:
+            flash("Too many login attempts, please try again in {} seconds".format(wait))
+            return render_template("login.html", title="Log In", form=form, user=current_user), 429
         user = User.query.filter_by(email_address=form.email_address.data).first()  # gets the user with the same email address in the database
         if user is None:  # checks if the users email exists
             flash("This user does not exist!")  # displays an error message
             return redirect(url_for('login'))  # redirects user to login page to try again
+        if not user.active:  # checked before the password, so rejected accounts don't cost a password hash
+            flash("This account is no longer active! Contact an admin if you need help")  # displays an error message
+            return redirect(url_for('login'))  # redirects user to login page to try again
         if not user.check_password(form.password.data):  # verify the password
             flash("Your email or password is wrong!")  # displays an error message
             return redirect(url_for('login'))  # redirects user to login page to try again
-        if not user.active:  # if user account is not active
-            flash("This account is no longer active! Contact an admin if you need help")  # displays an error message
-            return redirect(url_for('login'))  # redirects user to login page to try again
+        if user.password_needs_rehash():  # hashed with older settings, so it is saved again with the current ones
+            user.set_password(form.password.data)
+            db.session.commit()
+            forget_user(user.id)
         login_user(user)  # else if user information is valid login the
         flash("Successfully logged in as " + user.name + "!")  # displays message to user
         return redirect(url_for('homepage'))  # redirects user to home page
@@ -304,6 +551,7 @@ def reset_password():
     if form.validate_on_submit() and user.check_password(form.current_password.data):  # checks form is valid and that the current password is correct
         user.set_password(form.new_password.data)  # sets new password into database
         db.session.commit()  # commits changes to database
+        forget_user(user.id)  # the cached copy of the user is out of date
         flash("Successfully reset password")  # display message to user
         return redirect(url_for('homepage'))  # redirects user to home page
     return render_template("passwordreset.html", title='Reset Password', form=form, user=current_user)
@@ -319,6 +567,9 @@ def user_enable_disable(userid):
     user = User.query.filter_by(id=userid).first()  # finds user selected
     user.active = not user.active  # switches boolean value in table
     db.session.commit()
+    forget_user(user.id)
+    if not user.active:
+        end_user_sessions(user.id)  # logs them out everywhere
     return redirect(url_for("list_all_users"))
 
 
@@ -341,3 +592,13 @@ def page_not_found(e):
 @app.errorhandler(500)
 def internal_server_error(e):
     return render_template("500.html", user=current_user), 500
+
+
+# the app with every route registered, used by the production servers (wsgi.py and asgi.py)
+# the other modules add their routes with "from app import app", so the app itself is created once,
+# when this module is first imported, and this only checks the settings it needs to run
+def create_app():
+    if app.config['SECRET_KEY'] == 'you-will-never-guess' and not app.debug:
+        app.logger.warning("SECRET_KEY is not set, sessions can be forged until it is")
+    warm_up()  # compiles the templates etc. now rather than on the first requests (warmup.py)
+    return app
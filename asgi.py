@@ -0,0 +1,9 @@
+# Entry point for ASGI servers (needs asgiref and an ASGI server installed), e.g.
+#   uvicorn asgi:application --workers 4
+# Each request is handed to a thread pool, so requests waiting on the database or on saving a file
+# don't hold up the event loop or each other.
+from asgiref.wsgi import WsgiToAsgi
+
+from app import create_app
+
+application = WsgiToAsgi(create_app())
@@ -0,0 +1,113 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+from flask.cli import AppGroup
+from werkzeug.security import safe_join
+
+from app import app
+
+try:  # brotli is optional, without it only gzip copies are made
+    import brotli
+except ImportError:
+    brotli = None
+
+# Static files are linked with a hash of their contents in the url (asset_url), so the browser can keep
+# them forever and a changed file gets a new url. css and js are compressed ahead of time with
+# "flask assets compress" and the compressed copy is sent to browsers that accept it.
+
+ONE_YEAR = 365 * 24 * 60 * 60
+COMPRESSED_TYPES = ('.css', '.js')  # files worth compressing ahead of time
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]  # best first
+
+_hashes = {}  # (filename, modified time) -> short content hash
+
+
+# short hash of a static file's contents (worked out again only if the file changes)
+def file_hash(filename):
+    path = os.path.join(app.static_folder, filename)
+    key = (filename, os.path.getmtime(path))
+    if key not in _hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        _hashes[key] = digest.hexdigest()[:8]
+    return _hashes[key]
+
+
+# url for a file in the static folder with a hash of its contents, e.g. /static/css/site.css?v=1a2b3c4d
+def asset_url(filename):
+    return "{}/{}?v={}".format(app.static_url_path, filename, file_hash(filename))
+
+
+app.jinja_env.globals['asset_url'] = asset_url  # usable in every template
+
+
+# true if the file can never change (so browsers can cache it forever)
+def is_immutable(filename):
+    if request.args.get('v'):  # fingerprinted url from asset_url(), as long as it is for the current version
+        return request.args['v'] == file_hash(filename)
+    # content addressed photos (see storage.py) are named by their hash, e.g. images/userPhotos/3f/a2/...
+    parts = filename.split('/')
+    return parts[:2] == ['images', 'userPhotos'] and len(parts) == 5 and parts[2] != 'incoming'
+
+
+# replaces flask's static file view: sends precompressed copies and long lived cache headers
+# send_from_directory already answers If-None-Match / If-Modified-Since with 304s and Range requests with 206s
+def serve_static(filename):
+    original = safe_join(app.static_folder, filename)
+    if filename.endswith(COMPRESSED_TYPES) and original is not None and os.path.isfile(original):
+        accepted = request.accept_encodings
+        for encoding, ext in ENCODINGS:
+            compressed = original + ext
+            # the compressed copy is only used if it was made after the file was last changed
+            if accepted[encoding] and os.path.isfile(compressed) \
+                    and os.path.getmtime(compressed) >= os.path.getmtime(original):
+                response = send_from_directory(app.static_folder, filename + ext,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(app.static_folder, filename)
+        response.vary.add('Accept-Encoding')
+    else:
+        response = send_from_directory(app.static_folder, filename)
+    if is_immutable(filename):
+        response.cache_control.no_cache = None  # flask sets this by default
+        response.cache_control.public = True
+        response.cache_control.max_age = ONE_YEAR
+        response.cache_control.immutable = True
+    return response
+
+
+app.view_functions['static'] = serve_static
+
+
+# command line tools for static files (flask --app app assets ...)
+assets_cli = AppGroup('assets', help="Build static files.")
+
+
+@assets_cli.command('compress')
+def compress():
+    """Save gzip (and brotli if installed) copies of every css and js file."""
+    count = 0
+    for folder, _, filenames in os.walk(app.static_folder):
+        for filename in filenames:
+            if not filename.endswith(COMPRESSED_TYPES):
+                continue
+            path = os.path.join(folder, filename)
+            with open(path, 'rb') as file:
+                data = file.read()
+            with open(path + '.gz', 'wb') as file:
+                file.write(gzip.compress(data, 9))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as file:
+                    file.write(brotli.compress(data, quality=11))
+            count += 1
+    print("Compressed {} files{}".format(count, "" if brotli else " (gzip only, install Brotli for .br files)"))
+
+
+app.cli.add_command(assets_cli)
@@ -0,0 +1,194 @@
+# Load test / benchmark for every page of the app.
+#
+# Seeds a separate sqlite database with fake users, photos, todos and contact messages, then sends
+# requests to each route from several threads at once (through Flask's test client) and reports the
+# p50 / p95 / p99 latency, requests per second and SQL queries per request for each route, plus the
+# peak memory used. Results are printed as JSON so runs can be compared.
+#
+#   python benchmark.py --scale 1000 --clients 4 --requests 200 --output results.json
+#
+# Seeded databases are kept in the temp folder and reused, as seeding a million rows takes a while.
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+try:  # not available on windows
+    import resource
+except ImportError:
+    resource = None
+
+ROUTES = ['/gallery', '/gallery?after={photoid}', '/userPhotos/{photoid}', '/admin/list_all_photos',
+          '/contact_messages', '/todo', '/login']
+PASSWORD = 'benchmark'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark every route of the app.")
+    parser.add_argument('--scale', type=int, default=1000, help="rows in the photo, todo and contact tables")
+    parser.add_argument('--clients', type=int, default=4, help="threads sending requests at the same time")
+    parser.add_argument('--requests', type=int, default=100, help="requests sent to each route")
+    parser.add_argument('--routes', nargs='*', default=ROUTES, help="routes to test ({photoid} is filled in)")
+    parser.add_argument('--cache', default='none', help="CACHE_TYPE to run with (default none)")
+    parser.add_argument('--output', help="file to write the JSON results to (printed if not given)")
+    return parser.parse_args()
+
+
+# adds the fake rows in batches, bypassing the ORM so large scales seed quickly
+def seed(db, models, scale):
+    from werkzeug.security import generate_password_hash
+    password_hash = generate_password_hash(PASSWORD)  # every user shares one hash, hashing is slow
+    users = max(scale // 10, 2)
+    start = datetime(2022, 1, 1)
+    batch = 10000
+
+    def insert(table, make_row, count):
+        for first in range(0, count, batch):
+            rows = [make_row(number) for number in range(first + 1, min(first + batch, count) + 1)]
+            db.session.execute(table.insert(), rows)
+        db.session.commit()
+
+    insert(models.User.__table__, lambda n: {
+        'id': n, 'email_address': 'user{}@example.com'.format(n), 'name': 'User {}'.format(n),
+        'password_hash': password_hash, 'user_level': 2 if n == 1 else 1, 'active': True}, users)
+    insert(models.Photos.__table__, lambda n: {
+        'photoid': n, 'title': 'Photo {}'.format(n), 'filename': 'benchmark/{}.jpg'.format(n),
+        'userid': random.randint(1, users), 'dateSubmitted': start + timedelta(minutes=n),
+        'enabled': n % 20 != 0, 'status': 'ready', 'size': 100000}, scale)
+    insert(models.todo.__table__, lambda n: {
+        'id': n, 'user_id': random.randint(1, users), 'text': 'Todo {}'.format(n), 'done': n % 2 == 0}, scale)
+    insert(models.Contact.__table__, lambda n: {
+        'id': n, 'name': 'Visitor {}'.format(n), 'email': 'visitor{}@example.com'.format(n),
+        'message': 'Message number {}'.format(n), 'dateSubmitted': start + timedelta(minutes=n)}, scale)
+
+
+# most memory the process has used so far, in megabytes
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0  # bytes on mac, kilobytes on linux
+
+
+# value at a percentile of a sorted list
+def percentile(values, percent):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    args = parse_args()
+    database = os.path.join(tempfile.gettempdir(), 'ngunnawal_benchmark_{}.db'.format(args.scale))
+    # the app reads its configuration when it is imported
+    os.environ['DATABASE_URL'] = 'sqlite:///' + database
+    os.environ['CACHE_TYPE'] = args.cache
+    os.environ['JOB_WORKER_THREADS'] = '0'
+    os.environ['RATELIMIT_STORAGE'] = 'memory'
+    os.environ['SESSION_STORAGE'] = 'memory'
+    # the login rate limit isn't what is being measured (every client logs in as the same user)
+    os.environ['LOGIN_IP_BURST'] = os.environ['LOGIN_EMAIL_BURST'] = str(10 ** 6)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as webapp
+    import models
+    from sqlalchemy import event
+
+    flask_app, db = webapp.app, webapp.db
+    flask_app.config['WTF_CSRF_ENABLED'] = False
+    with flask_app.app_context():
+        if not os.path.exists(database):
+            print("Seeding {} rows into {}".format(args.scale, database), file=sys.stderr)
+            db.create_all()
+            seed(db, models, args.scale)
+        max_photoid = db.session.query(db.func.max(models.Photos.photoid)).scalar()
+        engine = db.engine
+
+    # counts the sql statements each thread runs
+    counter = threading.local()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(*args):
+        counter.queries = getattr(counter, 'queries', 0) + 1
+
+    # each client logs in once and keeps its session for every route
+    browsers = []
+    for _ in range(args.clients):
+        browser = flask_app.test_client()
+        response = browser.post('/login', data={'email_address': 'user1@example.com', 'password': PASSWORD})
+        if response.status_code != 302:
+            sys.exit("Logging in failed with status {}".format(response.status_code))
+        browsers.append(browser)
+
+    results = {}
+    failed = []
+    for route in args.routes:
+        latencies, queries, statuses = [], [], {}
+        lock = threading.Lock()
+        per_client = [args.requests // args.clients + (1 if n < args.requests % args.clients else 0)
+                      for n in range(args.clients)]
+
+        def client(browser, count):
+            for _ in range(count):
+                url = route.format(photoid=random.randint(1, max_photoid))
+                counter.queries = 0
+                began = time.perf_counter()
+                response = browser.get(url)
+                elapsed = time.perf_counter() - began
+                with lock:
+                    latencies.append(elapsed * 1000)
+                    queries.append(counter.queries)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        threads = [threading.Thread(target=client, args=(browser, count)) for browser, count in zip(browsers, per_client)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - began
+
+        latencies.sort()
+        results[route] = {
+            'requests': len(latencies),
+            'statuses': statuses,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'requests_per_second': len(latencies) / duration if duration else None,
+            'queries_per_request': sum(queries) / len(queries) if queries else None,
+        }
+        print("{:<28} p50 {:8.2f}ms  p95 {:8.2f}ms  {:7.1f} req/s  {:5.1f} queries".format(
+            route, results[route]['p50_ms'], results[route]['p95_ms'],
+            results[route]['requests_per_second'], results[route]['queries_per_request']), file=sys.stderr)
+        # a redirect or error page would be timed instead of the page itself
+        if any(not 200 <= status < 300 for status in statuses):
+            print("  warning: {} answered {}".format(route, statuses), file=sys.stderr)
+            failed.append(route)
+
+    report = {
+        'scale': args.scale,
+        'clients': args.clients,
+        'requests_per_route': args.requests,
+        'cache': args.cache,
+        'date': datetime.now().isoformat(),
+        'peak_rss_mb': peak_rss_mb(),
+        'routes': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+    if failed:
+        sys.exit("Some routes didn't answer 2xx: " + ", ".join(failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+import functools
+import hashlib
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, session, make_response
+from flask_login import current_user
+from markupsafe import Markup
+
+from app import app
+
+# Rendered pages and parts of pages are cached so they don't have to be rendered on every request.
+# Every entry has tags (e.g. "gallery", "photo:12"), and invalidate("gallery") throws away everything
+# with that tag. Each tag has a version number and entries remember the versions they were saved with,
+# so invalidating is just adding one to the version. Tag versions are small files in CACHE_DIR/tags, so
+# an invalidation in one process (e.g. "flask jobs work" finishing a photo) reaches every process on
+# the machine. CACHE_TYPE picks where entries are kept:
+#   "lru"  - in memory in each process (fastest)
+#   "disk" - files in CACHE_DIR shared by every process on the machine
+#   "none" - turns caching off
+# Both keep at most CACHE_MAX_ENTRIES entries.
+
+
+# writes to a temporary file then renames it, so readers never see half a file
+def write_file(path, data):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+# tag versions kept as one small file per tag
+class TagVersions(object):
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, tag):
+        return os.path.join(self.folder, hashlib.sha1(tag.encode()).hexdigest())
+
+    def get(self, tag):
+        try:
+            with open(self.path(tag)) as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self, tag):
+        write_file(self.path(tag), str(self.get(tag) + 1).encode())
+
+    def clear(self):
+        for filename in os.listdir(self.folder):
+            try:
+                os.remove(os.path.join(self.folder, filename))
+            except OSError:
+                pass
+
+
+# tag versions kept in this process only (for caches of things other processes never change)
+class LocalTagVersions(object):
+    def __init__(self):
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def get(self, tag):
+        return self.versions.get(tag, 0)
+
+    def bump(self, tag):
+        with self.lock:
+            self.versions[tag] = self.versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.versions.clear()
+
+
+# keeps the most recently used entries in memory
+class LRUCache(object):
+    def __init__(self, max_entries, tag_versions=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.tag_versions = tag_versions or LocalTagVersions()
+        self.lock = threading.Lock()
+
+    def get_entry(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)  # now the most recently used
+            return entry
+
+    def set_entry(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)  # drops the least recently used
+
+    def delete_entry(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def tag_version(self, tag):
+        return self.tag_versions.get(tag)
+
+    def bump_tag(self, tag):
+        self.tag_versions.bump(tag)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        self.tag_versions.clear()
+
+
+# keeps entries as files so every process on the machine shares them
+class DiskCache(object):
+    def __init__(self, folder, max_entries, tag_versions):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.tag_versions = tag_versions
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.folder, hashlib.sha1(key.encode()).hexdigest())
+
+    def get_entry(self, key):
+        try:
+            with open(self.path(key), 'rb') as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set_entry(self, key, entry):
+        write_file(self.path(key), pickle.dumps(entry))
+        if random.random() < 0.01:  # counting the files every time would be slow, so it is checked now and then
+            self.prune()
+
+    # deletes the oldest entries when there are more than max_entries
+    def prune(self):
+        entries = []
+        with os.scandir(self.folder) as scan:
+            for entry in scan:
+                if entry.is_file():
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.name))
+                    except OSError:  # deleted by another process
+                        pass
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for modified, filename in entries[:len(entries) - self.max_entries]:
+                self.delete_entry_file(filename)
+
+    def delete_entry(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def tag_version(self, tag):
+        return self.tag_versions.get(tag)
+
+    def bump_tag(self, tag):
+        self.tag_versions.bump(tag)
+
+    def clear(self):
+        for filename in os.listdir(self.folder):
+            if filename != 'tags':
+                self.delete_entry_file(filename)
+        self.tag_versions.clear()
+
+    def delete_entry_file(self, filename):
+        try:
+            os.remove(os.path.join(self.folder, filename))
+        except OSError:
+            pass
+
+
+# the cache used by the app, with hit / miss counts for the admin page
+class Cache(object):
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    # returns the cached value, or None if it isn't cached, has expired or one of its tags was invalidated
+    def get(self, key):
+        if self.backend is None:
+            return None
+        entry = self.backend.get_entry(key)
+        if entry is not None:
+            value, expires, tags = entry
+            if expires > time.time() and all(self.backend.tag_version(tag) == version for tag, version in tags):
+                self.hits += 1
+                return value
+            self.backend.delete_entry(key)
+        self.misses += 1
+        return None
+
+    def set(self, key, value, tags=(), timeout=None):
+        if self.backend is None:
+            return
+        tags = [(tag, self.backend.tag_version(tag)) for tag in tags]
+        self.backend.set_entry(key, (value, time.time() + (timeout or self.timeout), tags))
+
+    def delete(self, key):
+        if self.backend is not None:
+            self.backend.delete_entry(key)
+
+    # the tag's current version, which changes whenever it is invalidated
+    def tag_version(self, tag):
+        return self.backend.tag_version(tag) if self.backend is not None else 0
+
+    # throws away every entry with any of these tags
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.bump_tag(tag)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+        self.hits = self.misses = 0
+
+
+# creates the cache chosen in the config
+def create_cache(config):
+    tag_versions = TagVersions(os.path.join(config['CACHE_DIR'], 'tags'))
+    if config['CACHE_TYPE'] == 'lru':
+        backend = LRUCache(config['CACHE_MAX_ENTRIES'], tag_versions)
+    elif config['CACHE_TYPE'] == 'disk':
+        backend = DiskCache(config['CACHE_DIR'], config['CACHE_MAX_ENTRIES'], tag_versions)
+    else:
+        backend = None
+    return Cache(backend, config['CACHE_DEFAULT_TIMEOUT'])
+
+
+cache = create_cache(app.config)
+
+
+# caches the whole page for visitors who aren't logged in
+# pages with flash messages waiting to be shown are always rendered
+# args are the query string arguments the view reads and their types, only those are part of the cache
+# key so made up query strings (/?x=1, /?x=2...) share one entry instead of filling the cache
+def cached_page(*tags, args=None):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*view_args, **kwargs):
+            if request.method != 'GET' or not current_user.is_anonymous or session.get('_flashes'):
+                return view(*view_args, **kwargs)
+            key = 'page:' + request.path + '?' + '&'.join(
+                '{}={}'.format(name, request.args.get(name, type=kind)) for name, kind in sorted((args or {}).items()))
+            cached = cache.get(key)
+            if cached is not None:
+                body, content_type = cached
+                response = make_response(body)
+                response.content_type = content_type
+                return response
+            response = make_response(view(*view_args, **kwargs))
+            if response.status_code == 200:
+                cache.set(key, (response.get_data(), response.content_type), tags)
+            return response
+        return wrapper
+    return decorator
+
+
+# caches part of a template, used as {% call cached_fragment("key", ["tag"]) %} ... {% endcall %}
+def cached_fragment(key, tags=(), caller=None):
+    key = 'fragment:' + key
+    html = cache.get(key)
+    if html is None:
+        html = str(caller())
+        cache.set(key, html, tags)
+    return Markup(html)
+
+
+app.jinja_env.globals['cached_fragment'] = cached_fragment
@@ -1,4 +1,5 @@
 import os
+from database import engine_options
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -7,3 +8,74 @@ class Config(object):
     # Database configuration
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'ngunnawal.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool for server databases like postgres (needs psycopg2 installed), see database.py
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI,
+                                               pool_size=int(os.environ.get('DATABASE_POOL_SIZE') or 5),
+                                               max_overflow=int(os.environ.get('DATABASE_MAX_OVERFLOW') or 10),
+                                               pool_recycle=1800)
+    # Set on every sqlite connection
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # readers don't block writers
+        'busy_timeout': 5000,  # milliseconds to wait for a lock
+        'synchronous': 'NORMAL',  # safe with WAL and much faster than FULL
+        'mmap_size': 256 * 1024 * 1024,  # reads through memory mapping
+        'foreign_keys': 'ON',
+    }
+    # Number of photos shown on each page of the gallery
+    GALLERY_PAGE_SIZE = int(os.environ.get('GALLERY_PAGE_SIZE') or 24)
+    # Number of rows shown on each page of the admin lists
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE') or 50)
+    # Background jobs (worker.py): threads per process, retries and wait times in seconds
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS') or 2)
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_DELAY = 5
+    JOB_POLL_INTERVAL = 1
+    JOB_LEASE_TIMEOUT = 10 * 60  # a job still running after this long is assumed lost (e.g. its process was restarted)
+    # Photo uploads (uploads.py): sizes in bytes, expiry in seconds
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+    UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE') or 20 * 1024 * 1024)
+    UPLOAD_USER_QUOTA = int(os.environ.get('UPLOAD_USER_QUOTA') or 200 * 1024 * 1024)
+    UPLOAD_EXPIRY = 24 * 60 * 60
+    # Orphaned photo files (flask --app app storage gc): files newer than STORAGE_GC_MIN_AGE seconds are
+    # left alone, and quarantined files are deleted after STORAGE_QUARANTINE_DAYS
+    STORAGE_QUARANTINE_DIR = os.path.join(basedir, 'quarantine')
+    STORAGE_QUARANTINE_DAYS = 7
+    STORAGE_GC_MIN_AGE = 60 * 60
+    STORAGE_GC_BATCH_SIZE = 500
+    STORAGE_GC_PAUSE = 0.1
+    # Largest request accepted (the upload form without javascript sends the whole file at once)
+    MAX_CONTENT_LENGTH = UPLOAD_MAX_FILE_SIZE + 64 * 1024
+    # Page cache (cache.py): "lru" (in memory), "disk" (shared by every process) or "none", invalidations
+    # reach every process either way (through files in CACHE_DIR)
+    CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'lru'
+    CACHE_DIR = os.path.join(basedir, 'cache')
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_MAX_ENTRIES = 1000
+    # Compiled templates shared by every process (warmup.py), and how many seconds startup may take
+    TEMPLATE_CACHE_DIR = os.path.join(basedir, 'template_cache')
+    STARTUP_BUDGET = float(os.environ.get('STARTUP_BUDGET') or 3)
+    # Users kept in memory by id (models.get_user), and for how many seconds
+    USER_CACHE_SIZE = 1000
+    USER_CACHE_TTL = 30
+    # How passwords are hashed, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000" (a higher number is
+    # slower to check and harder to crack). Passwords are hashed again when users log in after a change
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    # Login attempts allowed (ratelimit.py): a burst, then this many a minute, per IP address and per account
+    LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST') or 20)
+    LOGIN_IP_PER_MINUTE = int(os.environ.get('LOGIN_IP_PER_MINUTE') or 10)
+    LOGIN_EMAIL_BURST = int(os.environ.get('LOGIN_EMAIL_BURST') or 5)
+    LOGIN_EMAIL_PER_MINUTE = int(os.environ.get('LOGIN_EMAIL_PER_MINUTE') or 2)
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE') or 'sqlite'  # "sqlite" (shared by every process) or "memory"
+    RATELIMIT_DB = os.path.join(basedir, 'ratelimit.db')
+    # Number of proxies / load balancers in front of the app that set X-Forwarded-For
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES') or 0)
+    # Sessions (sessions.py): "sqlite" (shared by every process), "memory" or "cookie" (flask's signed cookies)
+    SESSION_STORAGE = os.environ.get('SESSION_STORAGE') or 'sqlite'
+    SESSION_DB = os.path.join(basedir, 'sessions.db')
+    SESSION_MAX_ENTRIES = 10000
+    # Request instrumentation (metrics.py): off unless METRICS_ENABLED is set, PROFILE_SAMPLE_RATE is
+    # the share of requests run under cProfile (0 to 1), METRICS_TOKEN lets a scraper read /admin/metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+    PROFILE_DIR = os.path.join(basedir, 'profiles')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
@@ -0,0 +1,35 @@
+from sqlalchemy import event
+
+# Database tuning for the two kinds of database the app can run on (chosen by DATABASE_URL):
+#   sqlite   - each new connection is set up with the pragmas in SQLITE_PRAGMAS. WAL mode lets readers
+#              carry on while someone is writing, and busy_timeout makes writers wait for the lock
+#              instead of failing straight away with "database is locked"
+#   postgres (or another server database) - connections are pooled, see engine_options()
+
+
+# SQLALCHEMY_ENGINE_OPTIONS for a database url
+def engine_options(database_uri, pool_size, max_overflow, pool_recycle):
+    if database_uri.startswith('sqlite'):
+        return {}  # how long to wait for a lock is the busy_timeout pragma
+    return {
+        'pool_size': pool_size,  # connections kept open in each process
+        'max_overflow': max_overflow,  # extra connections allowed when the pool is busy
+        'pool_pre_ping': True,  # checks a connection still works before using it (e.g. after a database restart)
+        'pool_recycle': pool_recycle,  # replaces connections before the server closes idle ones
+    }
+
+
+# sets the pragmas on every new sqlite connection
+def setup_engine(app, db):
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = app.config['SQLITE_PRAGMAS']
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(connection, connection_record):
+        cursor = connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA {} = {}".format(name, value))
+        cursor.close()
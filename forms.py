@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError
-from wtforms import StringField, SubmitField, PasswordField, TextAreaField, FileField, BooleanField
+from wtforms import StringField, SubmitField, PasswordField, TextAreaField, FileField, BooleanField, SelectField
 from flask_wtf.file import FileRequired
 from models import User
 
@@ -37,7 +37,8 @@ class RegistrationForm(FlaskForm):
     submit = SubmitField("Register", render_kw={"class": "btn btn-primary"})
 
     def validate_email_address(self, email_address_to_register):
-        user = User.query.filter_by(email_address=email_address_to_register.data).first()
+        # only asks for the id, which the email index holds, so the user row itself isn't read
+        user = User.query.with_entities(User.id).filter_by(email_address=email_address_to_register.data).first()
         if user is not None:
             raise ValidationError("Please Use a Different Email Address)")
 
@@ -76,3 +77,9 @@ class TodoForm(FlaskForm):
     text = StringField('text', validators=[DataRequired()],
                        render_kw={"placeholder": "Add a new TODO item", "class": "form-control"})
     submit = SubmitField('Create new entry', render_kw={"class": "btn btn-primary"})
+
+
+# action to apply to the rows ticked on an admin page (the choices are set by each page)
+class BulkActionForm(FlaskForm):
+    action = SelectField('With selected', validators=[DataRequired()], render_kw={"class": "form-select form-select-sm"})
+    submit = SubmitField('Apply', render_kw={"class": "btn btn-secondary btn-sm"})
@@ -0,0 +1,19 @@
+# Settings for running the app with gunicorn (gunicorn -c gunicorn.conf.py wsgi:application)
+#   WEB_BIND     address to listen on (default 0.0.0.0:8000)
+#   WEB_WORKERS  worker processes (default two per cpu core plus one)
+#   WEB_THREADS  threads in each worker process (default 4)
+# "kill -HUP <master pid>" reloads gracefully: new workers are started with the new code and the
+# old ones finish the requests they are handling before they exit. (This needs preload_app off, a
+# preloaded app would be forked from the master's copy of the old code.)
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND') or '0.0.0.0:8000'
+workers = int(os.environ.get('WEB_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+threads = int(os.environ.get('WEB_THREADS') or 4)
+worker_class = 'gthread'
+preload_app = False  # each worker imports the app (and warms it up, see warmup.py) itself, so HUP loads new code
+timeout = 60
+graceful_timeout = 30  # seconds workers get to finish their requests on reload or shutdown
+max_requests = 1000  # workers are replaced now and then, with jitter so they don't all restart at once
+max_requests_jitter = 100
@@ -0,0 +1,32 @@
+import logging
+import os
+
+from flask import jsonify
+from sqlalchemy import text
+
+from app import app, db, UPLOAD_FOLDER
+
+# Endpoints for load balancers and process managers:
+#   /health - the process is up and answering requests (liveness)
+#   /ready  - the process can do useful work: the database answers and photos can be saved (readiness)
+#             answers 503 while something is wrong, so no traffic is sent to this process
+
+
+@app.route('/health')
+def health():
+    return jsonify(status='ok')
+
+
+@app.route('/ready')
+def ready():
+    checks = {}
+    try:
+        db.session.execute(text('SELECT 1'))
+        checks['database'] = 'ok'
+    except Exception:
+        logging.exception("Readiness check could not reach the database")
+        db.session.rollback()
+        checks['database'] = 'unavailable'
+    checks['uploads'] = 'ok' if os.access(UPLOAD_FOLDER, os.W_OK) else 'not writable'
+    is_ready = all(result == 'ok' for result in checks.values())
+    return jsonify(status='ok' if is_ready else 'unavailable', checks=checks), 200 if is_ready else 503
@@ -0,0 +1,113 @@
+import hashlib
+import os
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+Image.init()  # loads the Pillow plugins so we can check which formats can be saved
+
+# longest edge (in pixels) of each resized copy we make of an uploaded photo
+VARIANT_SIZES = {'thumb': 320, 'medium': 1024}
+
+# modern formats saved next to each variant, best first (only if this Pillow build can write them)
+ALT_FORMATS = [fmt for fmt in ('avif', 'webp') if fmt.upper() in Image.SAVE]
+
+# Pillow format name for each file extension we save
+SAVE_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'avif': 'AVIF', 'webp': 'WEBP'}
+
+# extension used for each image format that can be uploaded
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+# quality setting for each lossy format (roughly the same visual quality for each)
+QUALITY = {'JPEG': 80, 'WEBP': 75, 'AVIF': 55}
+
+
+# name of a variant file, e.g. ("abc.jpg", "thumb", "webp") -> "abc_thumb.webp"
+def variant_filename(filename, size=None, ext=None):
+    stem, original_ext = os.path.splitext(filename)
+    if size is not None:
+        stem = stem + "_" + size
+    return stem + "." + (ext or original_ext[1:])
+
+
+# saves one image in the given extension with sensible compression settings
+def save_image(image, path, ext):
+    fmt = SAVE_FORMATS[ext]
+    if fmt == 'JPEG' and image.mode != 'RGB':  # jpeg has no transparency
+        image = image.convert('RGB')
+    if fmt == 'PNG':
+        image.save(path, fmt, optimize=True)
+    else:
+        image.save(path, fmt, quality=QUALITY[fmt])
+
+
+# raised when an uploaded file isn't an image we can read
+class InvalidImage(Exception):
+    pass
+
+
+# checks the file really is an image and re-saves it without EXIF data (gps location, camera details etc.)
+def strip_metadata(folder, filename):
+    path = os.path.join(folder, filename)
+    try:
+        with Image.open(path) as original:
+            original.verify()  # checks the file isn't truncated or corrupt
+    except (UnidentifiedImageError, SyntaxError, Image.DecompressionBombError) as error:
+        raise InvalidImage(str(error))
+    with Image.open(path) as original:
+        if original.format not in ('JPEG', 'PNG'):  # gifs don't carry exif, and re-saving would lose animation
+            return
+        image = ImageOps.exif_transpose(original)  # keeps the orientation the exif data described
+        image.load()
+        fmt = original.format
+        icc_profile = original.info.get('icc_profile')  # colour profile is kept so colours don't shift
+    if fmt == 'JPEG':
+        image.save(path, fmt, quality=95, icc_profile=icc_profile)
+    else:
+        image.save(path, fmt, optimize=True, icc_profile=icc_profile)
+
+
+# extension a stored image is saved with, from its contents rather than its name, so identical files
+# always get the same name (e.g. a photo uploaded as .jpeg and again as .jpg)
+def image_extension(folder, filename):
+    with Image.open(os.path.join(folder, filename)) as image:
+        fmt = image.format
+    return FORMAT_EXTENSIONS.get(fmt, os.path.splitext(filename)[1][1:].lower())
+
+
+# sha256 of a file's contents, read in chunks so large files don't use much memory
+def fingerprint(folder, filename):
+    digest = hashlib.sha256()
+    with open(os.path.join(folder, filename), 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# creates the thumbnail, medium and full size copies of an uploaded photo (plus avif/webp versions)
+# returns the column values to store on the Photos model
+def build_variants(folder, filename):
+    with Image.open(os.path.join(folder, filename)) as original:
+        image = ImageOps.exif_transpose(original)  # rotates phone photos the right way up
+        image.load()
+    ext = os.path.splitext(filename)[1][1:].lower()
+    if ext not in ('jpg', 'jpeg', 'png'):  # gifs etc. get png copies
+        ext = 'png'
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'P') else 'RGB')
+
+    info = {'width': image.width, 'height': image.height}
+    for size, max_edge in VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((max_edge, max_edge))  # keeps the aspect ratio, never makes the image bigger
+        variant = variant_filename(filename, size, ext)
+        save_image(resized, os.path.join(folder, variant), ext)
+        for alt_ext in ALT_FORMATS:
+            save_image(resized, os.path.join(folder, variant_filename(filename, size, alt_ext)), alt_ext)
+        info[size] = variant
+        info[size + '_width'] = resized.width
+        info[size + '_height'] = resized.height
+
+    # the original stays as the full size copy, we only add the modern formats next to it
+    for alt_ext in ALT_FORMATS:
+        save_image(image, os.path.join(folder, variant_filename(filename, ext=alt_ext)), alt_ext)
+    info['formats'] = ",".join(ALT_FORMATS)
+    return info
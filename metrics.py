@@ -0,0 +1,179 @@
+import cProfile
+import os
+import random
+import threading
+import time
+
+from flask import g, request, has_request_context, abort, Response, before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+
+from app import app, db
+from cache import cache
+
+# Request instrumentation, turned on with METRICS_ENABLED (nothing is hooked in when it is off):
+#   - SQL statements and their time are counted for each request (SQLAlchemy engine events)
+#   - template rendering is timed
+#   - every response gets a Server-Timing header, shown in the browser's developer tools network tab
+#   - totals for each endpoint are kept in memory and served in Prometheus format at /admin/metrics
+#   - PROFILE_SAMPLE_RATE of requests (e.g. 0.01 for 1 in 100) are run under cProfile and the stats
+#     saved in PROFILE_DIR, open them with "python -m pstats <file>" or snakeviz
+# Totals are for this process only, so with several worker processes each one reports its own.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+
+
+# running totals for one endpoint
+class EndpointStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)  # requests that took at most each bucket's time
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statuses = {}
+
+
+_stats = {}  # endpoint -> EndpointStats
+_lock = threading.Lock()
+_profiler_lock = threading.Lock()  # python can only run one profiler at a time
+
+
+# adds a finished request to the totals
+def record(endpoint, status, seconds, queries, query_seconds, template_seconds):
+    with _lock:
+        stats = _stats.get(endpoint)
+        if stats is None:
+            stats = _stats[endpoint] = EndpointStats()
+        stats.requests += 1
+        stats.seconds += seconds
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats.buckets[index] += 1
+        stats.queries += queries
+        stats.query_seconds += query_seconds
+        stats.template_seconds += template_seconds
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+
+# the totals in the Prometheus text format
+def prometheus_text():
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} {}".format(name, kind))
+        add_samples(name, samples)
+
+    def add_samples(name, samples):
+        for labels, value in samples:
+            label_text = ",".join('{}="{}"'.format(key, str(label).replace('"', '\\"')) for key, label in labels)
+            lines.append("{}{{{}}} {}".format(name, label_text, value) if label_text else "{} {}".format(name, value))
+
+    with _lock:
+        endpoints = sorted(_stats.items())
+        metric('http_requests_total', 'counter', "Requests handled, by endpoint and status code.",
+               [((('endpoint', endpoint), ('status', status)), count)
+                for endpoint, stats in endpoints for status, count in sorted(stats.statuses.items())])
+        metric('http_request_duration_seconds', 'histogram', "Time taken to handle requests.", [])
+        for endpoint, stats in endpoints:
+            add_samples('http_request_duration_seconds_bucket',
+                        [((('endpoint', endpoint), ('le', bound)), count) for bound, count in zip(LATENCY_BUCKETS, stats.buckets)]
+                        + [((('endpoint', endpoint), ('le', '+Inf')), stats.requests)])
+            add_samples('http_request_duration_seconds_sum', [((('endpoint', endpoint),), stats.seconds)])
+            add_samples('http_request_duration_seconds_count', [((('endpoint', endpoint),), stats.requests)])
+        metric('sql_queries_total', 'counter', "SQL statements run, by endpoint.",
+               [((('endpoint', endpoint),), stats.queries) for endpoint, stats in endpoints])
+        metric('sql_query_seconds_total', 'counter', "Time spent running SQL statements, by endpoint.",
+               [((('endpoint', endpoint),), stats.query_seconds) for endpoint, stats in endpoints])
+        metric('template_render_seconds_total', 'counter', "Time spent rendering templates, by endpoint.",
+               [((('endpoint', endpoint),), stats.template_seconds) for endpoint, stats in endpoints])
+    metric('page_cache_hits_total', 'counter', "Page cache hits.", [((), cache.hits)])
+    metric('page_cache_misses_total', 'counter', "Page cache misses.", [((), cache.misses)])
+    return "\n".join(lines) + "\n"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context() and 'metrics_start' in g:  # queries run by background jobs aren't counted
+        g.metrics_queries += 1
+        g.metrics_query_seconds += elapsed
+
+
+def start_template(sender, template, context, **extra):
+    if 'metrics_start' in g:
+        g.metrics_template_start = time.perf_counter()
+
+
+def end_template(sender, template, context, **extra):
+    if 'metrics_template_start' in g:
+        g.metrics_template_seconds += time.perf_counter() - g.pop('metrics_template_start')
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_seconds = 0.0
+    g.metrics_template_seconds = 0.0
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate and _profiler_lock.acquire(blocking=False):
+        g.metrics_profiler = cProfile.Profile()
+        g.metrics_profiler.enable()
+
+
+def finish_request(response):
+    if 'metrics_start' not in g:  # another before_request function answered the request before ours ran
+        return response
+    seconds = time.perf_counter() - g.metrics_start
+    endpoint = request.endpoint or 'unknown'
+    record(endpoint, response.status_code, seconds, g.metrics_queries, g.metrics_query_seconds,
+           g.metrics_template_seconds)
+    response.headers['Server-Timing'] = 'db;dur={:.1f};desc="{} queries", tpl;dur={:.1f}, app;dur={:.1f}'.format(
+        g.metrics_query_seconds * 1000, g.metrics_queries, g.metrics_template_seconds * 1000, seconds * 1000)
+    return response
+
+
+# stops the profiler (if this request was sampled) and saves its stats, even if the view raised an error
+def save_profile(exception):
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    _profiler_lock.release()
+    os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+    profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], '{}-{}.prof'.format(
+        request.endpoint or 'unknown', int(time.time() * 1000))))
+
+
+# hooks the instrumentation into the app and the database engine
+def setup_metrics():
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    before_render_template.connect(start_template, app)
+    template_rendered.connect(end_template, app)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(save_profile)
+
+
+if app.config['METRICS_ENABLED']:
+    setup_metrics()
+
+
+# metrics for Prometheus (administrators, or a scraper sending "Authorization: Bearer <METRICS_TOKEN>")
+@app.route('/admin/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if not (token and request.headers.get('Authorization') == 'Bearer ' + token):
+        if current_user.is_anonymous or not current_user.is_admin():
+            abort(404)
+    if not app.config['METRICS_ENABLED']:
+        return Response("# metrics are turned off, set METRICS_ENABLED=1\n", 404, content_type='text/plain; charset=utf-8')
+    return Response(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
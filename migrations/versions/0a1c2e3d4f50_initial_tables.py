@@ -0,0 +1,66 @@
+"""initial tables
+
+Revision ID: 0a1c2e3d4f50
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a1c2e3d4f50'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# The tables the site had before it used migrations, so "flask db upgrade" can build a new database
+# (e.g. on Postgres) from nothing. Databases made before then already have them, so they are skipped.
+TABLES = ['contact', 'photos', 'todo', 'user']
+
+
+def upgrade():
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'contact' not in existing:
+        op.create_table('contact',
+                        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+                        sa.Column('name', sa.Text(), nullable=True),
+                        sa.Column('email', sa.Text(), nullable=True),
+                        sa.Column('message', sa.Text(), nullable=True),
+                        sa.Column('dateSubmitted', sa.DateTime(), nullable=True),
+                        sa.PrimaryKeyConstraint('id'),
+                        sqlite_autoincrement=True)
+    if 'photos' not in existing:
+        op.create_table('photos',
+                        sa.Column('photoid', sa.Integer(), autoincrement=True, nullable=False),
+                        sa.Column('title', sa.String(length=255), nullable=True),
+                        sa.Column('filename', sa.String(length=255), nullable=True),
+                        sa.Column('userid', sa.Integer(), nullable=True),
+                        sa.Column('dateSubmitted', sa.DateTime(), nullable=True),
+                        sa.Column('enabled', sa.Boolean(), server_default=sa.true(), nullable=True),
+                        sa.PrimaryKeyConstraint('photoid'),
+                        sqlite_autoincrement=True)
+    if 'todo' not in existing:
+        op.create_table('todo',
+                        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+                        sa.Column('text', sa.Text(), nullable=True),
+                        sa.Column('done', sa.Boolean(), nullable=True),
+                        sa.Column('user_id', sa.Integer(), nullable=True),
+                        sa.PrimaryKeyConstraint('id'),
+                        sqlite_autoincrement=True)
+    if 'user' not in existing:
+        op.create_table('user',
+                        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+                        sa.Column('email_address', sa.String(length=255), nullable=True),
+                        sa.Column('name', sa.String(length=255), nullable=True),
+                        sa.Column('password_hash', sa.String(length=255), nullable=True),
+                        sa.Column('user_level', sa.Integer(), nullable=True),
+                        sa.Column('active', sa.Boolean(), server_default=sa.true(), nullable=True),
+                        sa.PrimaryKeyConstraint('id'),
+                        sqlite_autoincrement=True)
+
+
+def downgrade():
+    for name in reversed(TABLES):
+        op.drop_table(name)
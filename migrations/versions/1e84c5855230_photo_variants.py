@@ -0,0 +1,42 @@
+"""photo variants
+
+Revision ID: 1e84c5855230
+Revises: 3be5245778e5
+Create Date: 2026-10-18 09:08:39.811381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e84c5855230'
+down_revision = '3be5245778e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('thumb', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('thumb_width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('thumb_height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('medium', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('medium_width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('medium_height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('formats', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.drop_column('formats')
+        batch_op.drop_column('medium_height')
+        batch_op.drop_column('medium_width')
+        batch_op.drop_column('medium')
+        batch_op.drop_column('thumb_height')
+        batch_op.drop_column('thumb_width')
+        batch_op.drop_column('thumb')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
@@ -0,0 +1,26 @@
+"""photo neighbour index
+
+Revision ID: 3a8e61f0b7c4
+Revises: e4b9a0c3d215
+Create Date: 2026-10-18 10:58:07.331846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a8e61f0b7c4'
+down_revision = 'e4b9a0c3d215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.create_index('ix_photos_enabled_status_photoid', ['enabled', 'status', 'photoid'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.drop_index('ix_photos_enabled_status_photoid')
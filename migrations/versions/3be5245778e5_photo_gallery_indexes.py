@@ -0,0 +1,30 @@
+"""photo gallery indexes
+
+Revision ID: 3be5245778e5
+Revises: 0a1c2e3d4f50
+Create Date: 2026-10-18 09:07:08.174909
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3be5245778e5'
+down_revision = '0a1c2e3d4f50'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_photos_userid'), ['userid'], unique=False)
+        batch_op.create_index(batch_op.f('ix_photos_enabled'), ['enabled'], unique=False)
+        batch_op.create_index(batch_op.f('ix_photos_dateSubmitted'), ['dateSubmitted'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_photos_dateSubmitted'))
+        batch_op.drop_index(batch_op.f('ix_photos_enabled'))
+        batch_op.drop_index(batch_op.f('ix_photos_userid'))
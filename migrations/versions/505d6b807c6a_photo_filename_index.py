@@ -0,0 +1,28 @@
+"""photo filename index
+
+Revision ID: 505d6b807c6a
+Revises: 6a6db07c08d3
+Create Date: 2026-10-18 09:11:46.377923
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '505d6b807c6a'
+down_revision = '6a6db07c08d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_photos_filename'), ['filename'], unique=False)
+        batch_op.create_index(batch_op.f('ix_photos_fingerprint'), ['fingerprint'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_photos_fingerprint'))
+        batch_op.drop_index(batch_op.f('ix_photos_filename'))
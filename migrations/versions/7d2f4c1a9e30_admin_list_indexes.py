@@ -0,0 +1,32 @@
+"""admin list indexes
+
+Revision ID: 7d2f4c1a9e30
+Revises: b00db527aa1b
+Create Date: 2026-10-18 10:02:14.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2f4c1a9e30'
+down_revision = 'b00db527aa1b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('contact', schema=None) as batch_op:
+        batch_op.create_index('ix_contact_dateSubmitted_id', ['dateSubmitted', 'id'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_email_address_id', ['email_address', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_email_address_id')
+
+    with op.batch_alter_table('contact', schema=None) as batch_op:
+        batch_op.drop_index('ix_contact_dateSubmitted_id')
@@ -0,0 +1,27 @@
+"""unique user email
+
+Revision ID: 9c5d2e7b4f61
+Revises: 3a8e61f0b7c4
+Create Date: 2026-10-18 11:24:40.118563
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c5d2e7b4f61'
+down_revision = '3a8e61f0b7c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # two people registering the same email address at the same moment can't both succeed
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('uq_user_email_address', ['email_address'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('uq_user_email_address')
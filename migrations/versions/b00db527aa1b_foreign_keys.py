@@ -0,0 +1,54 @@
+"""foreign keys
+
+Revision ID: b00db527aa1b
+Revises: c91bc93dcce9
+Create Date: 2026-10-18 09:19:29.917960
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b00db527aa1b'
+down_revision = 'c91bc93dcce9'
+branch_labels = None
+depends_on = None
+
+
+# sqlite has to copy a table to add a foreign key, these keep the tables' AUTOINCREMENT ids going
+AUTOINCREMENT = {'sqlite_autoincrement': True}
+
+
+def sequences():
+    if op.get_bind().dialect.name != 'sqlite':
+        return {}
+    return dict(op.get_bind().execute(sa.text("SELECT name, seq FROM sqlite_sequence")).fetchall())
+
+
+def restore_sequences(saved):
+    for name, seq in saved.items():
+        op.execute(sa.text("UPDATE sqlite_sequence SET seq = MAX(seq, :seq) WHERE name = :name")
+                   .bindparams(seq=seq, name=name))
+
+
+def upgrade():
+    saved = sequences()
+    with op.batch_alter_table('photos', schema=None, table_kwargs=AUTOINCREMENT) as batch_op:
+        batch_op.create_foreign_key('fk_photos_userid_user', 'user', ['userid'], ['id'])
+
+    with op.batch_alter_table('todo', schema=None, table_kwargs=AUTOINCREMENT) as batch_op:
+        batch_op.create_index(batch_op.f('ix_todo_user_id'), ['user_id'], unique=False)
+        batch_op.create_foreign_key('fk_todo_user_id_user', 'user', ['user_id'], ['id'])
+    restore_sequences(saved)
+
+
+def downgrade():
+    saved = sequences()
+    with op.batch_alter_table('todo', schema=None, table_kwargs=AUTOINCREMENT) as batch_op:
+        batch_op.drop_constraint('fk_todo_user_id_user', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_todo_user_id'))
+
+    with op.batch_alter_table('photos', schema=None, table_kwargs=AUTOINCREMENT) as batch_op:
+        batch_op.drop_constraint('fk_photos_userid_user', type_='foreignkey')
+    restore_sequences(saved)
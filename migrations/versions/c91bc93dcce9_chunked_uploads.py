@@ -0,0 +1,44 @@
+"""chunked uploads
+
+Revision ID: c91bc93dcce9
+Revises: 505d6b807c6a
+Create Date: 2026-10-18 09:13:21.539646
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c91bc93dcce9'
+down_revision = '505d6b807c6a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('userid', sa.Integer(), nullable=True),
+    sa.Column('title', sa.String(length=255), nullable=True),
+    sa.Column('filename', sa.String(length=255), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=True),
+    sa.Column('received', sa.Integer(), nullable=True),
+    sa.Column('dateSubmitted', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_userid'), ['userid'], unique=False)
+
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('size', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.drop_column('size')
+
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_userid'))
+
+    op.drop_table('upload')
@@ -0,0 +1,27 @@
+"""job lease
+
+Revision ID: d4b7e1a09c52
+Revises: 9c5d2e7b4f61
+Create Date: 2026-10-18 15:02:11.403917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b7e1a09c52'
+down_revision = '9c5d2e7b4f61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # when a running job was claimed, so jobs left running by a process that stopped can be run again
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('claimed_at')
@@ -0,0 +1,56 @@
+"""full text search
+
+Revision ID: e4b9a0c3d215
+Revises: 7d2f4c1a9e30
+Create Date: 2026-10-18 10:31:52.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b9a0c3d215'
+down_revision = '7d2f4c1a9e30'
+branch_labels = None
+depends_on = None
+
+# FTS5 indexes for search.py: (index, table, id column, indexed columns)
+# they are "external content" tables, so the text is only stored once (in the original table)
+INDEXES = [
+    ('photos_fts', 'photos', 'photoid', ['title']),
+    ('contact_fts', 'contact', 'id', ['name', 'email', 'message']),
+    ('todo_fts', 'todo', 'id', ['text']),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':  # other databases are searched with LIKE
+        return
+    for index, source, id_column, columns in INDEXES:
+        names = ', '.join(columns)
+        new_values = ', '.join('new.' + name for name in columns)
+        old_values = ', '.join('old.' + name for name in columns)
+        op.execute("CREATE VIRTUAL TABLE {} USING fts5({}, content='{}', content_rowid='{}', "
+                   "tokenize='unicode61 remove_diacritics 2')".format(index, names, source, id_column))
+        # keeps the index in step with the table
+        op.execute("CREATE TRIGGER {0}_insert AFTER INSERT ON {1} BEGIN "
+                   "INSERT INTO {0}(rowid, {2}) VALUES (new.{3}, {4}); END"
+                   .format(index, source, names, id_column, new_values))
+        op.execute("CREATE TRIGGER {0}_delete AFTER DELETE ON {1} BEGIN "
+                   "INSERT INTO {0}({0}, rowid, {2}) VALUES ('delete', old.{3}, {5}); END"
+                   .format(index, source, names, id_column, new_values, old_values))
+        op.execute("CREATE TRIGGER {0}_update AFTER UPDATE OF {2} ON {1} BEGIN "
+                   "INSERT INTO {0}({0}, rowid, {2}) VALUES ('delete', old.{3}, {5}); "
+                   "INSERT INTO {0}(rowid, {2}) VALUES (new.{3}, {4}); END"
+                   .format(index, source, names, id_column, new_values, old_values))
+        op.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(index))  # indexes the existing rows
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for index, source, id_column, columns in reversed(INDEXES):
+        for trigger in ('insert', 'delete', 'update'):
+            op.execute("DROP TRIGGER IF EXISTS {}_{}".format(index, trigger))
+        op.execute("DROP TABLE IF EXISTS {}".format(index))
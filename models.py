@@ -1,7 +1,15 @@
-from app import db, login
+import os
+import time
+from app import app, db, login
+from cache import Cache, LRUCache, TagVersions
 from datetime import datetime
-from flask_login import UserMixin
+from flask import session, has_request_context
+from flask_login import UserMixin, user_logged_out
+from sqlalchemy.orm import make_transient_to_detached
 from werkzeug.security import generate_password_hash, check_password_hash
+from images import variant_filename
+
+PHOTO_URL = "/static/images/userPhotos/"  # where uploaded photos are served from
 
 
 # for contact us form to use what the user has submitted
@@ -12,6 +20,8 @@ class Contact(db.Model):
     message = db.Column(db.Text)
     dateSubmitted = db.Column(db.DateTime)
 
+    __table_args__ = (db.Index('ix_contact_dateSubmitted_id', 'dateSubmitted', 'id'),)  # pages of messages by date
+
     def __init__(self, name, email, message):
         self.name = name
         self.email = email
@@ -23,10 +33,26 @@ class Contact(db.Model):
 class Photos(db.Model):
     photoid = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255))
-    filename = db.Column(db.String(255))
-    userid = db.Column(db.Integer)
-    dateSubmitted = db.Column(db.DateTime)
-    enabled = db.Column(db.Boolean)
+    filename = db.Column(db.String(255), index=True)  # indexed to count the photos sharing a file (see storage.py)
+    userid = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)  # indexed for uploader lookups
+    dateSubmitted = db.Column(db.DateTime, index=True)
+    enabled = db.Column(db.Boolean, index=True)  # indexed so the gallery can filter in SQL
+    # resized copies made when the photo is uploaded (see images.py)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    thumb = db.Column(db.String(255))
+    thumb_width = db.Column(db.Integer)
+    thumb_height = db.Column(db.Integer)
+    medium = db.Column(db.String(255))
+    medium_width = db.Column(db.Integer)
+    medium_height = db.Column(db.Integer)
+    formats = db.Column(db.String(32))  # extra formats saved next to each copy e.g. "avif,webp"
+    status = db.Column(db.String(16), index=True, default='pending')  # pending / ready / failed (see worker.py)
+    fingerprint = db.Column(db.String(64), index=True)  # sha256 of the processed file
+    size = db.Column(db.Integer)  # bytes uploaded, counted towards the user's quota
+
+    # finding the next / previous photo shown in the gallery is a single index seek
+    __table_args__ = (db.Index('ix_photos_enabled_status_photoid', 'enabled', 'status', 'photoid'),)
 
     # this functions will make it easier to create new entries in the database when uploading images
     def __init__(self, title, filename, userid, enabled):
@@ -36,11 +62,73 @@ class Photos(db.Model):
         self.dateSubmitted = datetime.today()
         self.enabled = enabled
 
+    # stores the values returned by images.build_variants()
+    def set_variants(self, info):
+        for key, value in info.items():
+            setattr(self, key, value)
+
+    # url of the smallest copy of the image (falls back to the original for old uploads)
+    def thumb_url(self):
+        return PHOTO_URL + (self.thumb or self.filename)
+
+    # url of the medium sized copy (the size the photo page shows), optionally in another format (e.g. "webp")
+    def medium_url(self, ext=None):
+        if not self.medium:  # uploaded before resized copies were made
+            return PHOTO_URL + self.filename
+        return PHOTO_URL + variant_filename(self.medium, ext=ext)
+
+    # srcset attribute listing every size of the image, optionally in another format (e.g. "webp")
+    def srcset(self, ext=None):
+        if not self.thumb:  # uploaded before resized copies were made
+            return PHOTO_URL + self.filename
+        sizes = [(self.thumb, self.thumb_width), (self.medium, self.medium_width), (self.filename, self.width)]
+        if ext is not None:
+            sizes = [(variant_filename(name, ext=ext), width) for name, width in sizes]
+        return ", ".join("{}{} {}w".format(PHOTO_URL, name, width) for name, width in sizes)
+
+    # extra formats the image has been saved in, as a list
+    def format_list(self):
+        return self.formats.split(",") if self.formats else []
+
+
+# photo uploads that are still being received in chunks (see uploads.py)
+class Upload(db.Model):
+    id = db.Column(db.String(36), primary_key=True)  # random uuid so upload urls can't be guessed
+    userid = db.Column(db.Integer, index=True)
+    title = db.Column(db.String(255))
+    filename = db.Column(db.String(255))  # partly uploaded file in the incoming folder
+    size = db.Column(db.Integer)  # total bytes expected
+    received = db.Column(db.Integer, default=0)  # bytes written so far
+    dateSubmitted = db.Column(db.DateTime, default=datetime.today)
+
+
+# background jobs waiting to be run by worker.py
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(32))  # name of the function in worker.JOBS to run
+    photoid = db.Column(db.Integer)  # photo the job works on
+    status = db.Column(db.String(16), default='queued')  # queued / running / done / failed
+    attempts = db.Column(db.Integer, default=0)
+    run_after = db.Column(db.DateTime)  # not run before this time (used to back off after a failure)
+    claimed_at = db.Column(db.DateTime)  # when a worker started running it (see worker.requeue_expired)
+    last_error = db.Column(db.Text)
+    dateSubmitted = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),)  # finding the next job to run
+
+    def __init__(self, kind, photoid):
+        self.kind = kind
+        self.photoid = photoid
+        self.status = 'queued'
+        self.attempts = 0
+        self.dateSubmitted = datetime.today()
+        self.run_after = self.dateSubmitted
+
 
 # for To do form to use what the user has submitted
 class todo (db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     text = db.Column(db.Text)
     done = db.Column(db.Boolean)
 
@@ -50,17 +138,34 @@ class todo (db.Model):
         self.done = done
 
 
+_hash_settings = {}
+
+
+# the settings at the start of a hash made with a method, e.g. "scrypt" -> "scrypt:32768:8:1"
+def hash_settings(method):
+    if method not in _hash_settings:
+        _hash_settings[method] = generate_password_hash('', method=method).split('$', 1)[0]
+    return _hash_settings[method]
+
+
 # for user registration
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    email_address = db.Column(db.String(255), unique=True)
+    email_address = db.Column(db.String(255))
     name = db.Column(db.String(255))
     password_hash = db.Column(db.String(255))
     user_level = db.Column(db.Integer)
     active = db.Column(db.Boolean)
 
+    __table_args__ = (db.Index('ix_user_email_address_id', 'email_address', 'id'),  # logging in, and pages of users by email
+                      db.Index('uq_user_email_address', 'email_address', unique=True))  # one account per email address
+
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+
+    # true if the password was hashed with other settings than PASSWORD_HASH_METHOD
+    def password_needs_rehash(self):
+        return str(self.password_hash).split('$', 1)[0] != hash_settings(app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -72,7 +177,82 @@ class User(UserMixin, db.Model):
             return False
 
 
+# Users are kept in a small in-memory cache (by id) so logged in requests and uploader names don't
+# query the user table every time. The cached copies are detached from the database session, so
+# they are merged into the current session before being used as current_user. Anything that changes
+# a user must call forget_user() after committing, which invalidates the user's tag so every process
+# (and every session's copy, see session_user) loads them again on its next request.
+user_cache = Cache(LRUCache(app.config['USER_CACHE_SIZE'], TagVersions(os.path.join(app.config['CACHE_DIR'], 'tags'))),
+                   app.config['USER_CACHE_TTL'])
+
+
+# a copy of a user not tied to this request's database session, so it is still readable after the request ends
+def detached_user(columns):
+    user = User(**columns)
+    make_transient_to_detached(user)
+    return user
+
+
+# cached copy of a user (None if there is no user with that id), only for reading
+def get_user(userid):
+    user = user_cache.get('user:' + str(userid))
+    if user is None:
+        found = db.session.get(User, int(userid))
+        if found is None:
+            return None
+        user = detached_user({column.key: getattr(found, column.key) for column in User.__table__.columns})
+        user_cache.set('user:' + str(userid), user, ['user:' + str(userid)])
+    return user
+
+
+# columns of the logged in user kept in their session (not the password hash, the session store
+# shouldn't hold anything that could be used to log in)
+SESSION_USER_COLUMNS = [column.key for column in User.__table__.columns if column.key != 'password_hash']
+
+
+# the logged in user is also kept in their session when sessions are stored on the server (sessions.py),
+# which every process can read, so a process that hasn't cached the user yet doesn't query for them
+# (the password hash is loaded from the database if it is needed)
+def session_user(userid):
+    saved = session.get('_user_copy')
+    version = user_cache.tag_version('user:' + str(userid))
+    if saved is None or saved['columns']['id'] != int(userid) or saved.get('version') != version \
+            or saved['saved'] < time.time() - app.config['USER_CACHE_TTL']:
+        user = get_user(userid)
+        if user is not None and app.config['SESSION_STORAGE'] != 'cookie':  # would make the cookie much bigger
+            session['_user_copy'] = {'saved': time.time(), 'version': version,
+                                     'columns': {key: getattr(user, key) for key in SESSION_USER_COLUMNS}}
+        return user
+    return detached_user(saved['columns'])
+
+
+# removes a user from the cache, call after any change to the user is committed
+def forget_user(userid):
+    user_cache.delete('user:' + str(userid))
+    user_cache.invalidate('user:' + str(userid))  # for the other processes
+    if has_request_context() and session.get('_user_copy', {}).get('columns', {}).get('id') == int(userid):
+        session.pop('_user_copy')  # e.g. the user changed their own password
+
+
+# the copy kept by session_user() goes when the user logs out
+@user_logged_out.connect_via(app)
+def forget_session_user(sender, user):
+    session.pop('_user_copy', None)
+
+
+# name of the user who uploaded a photo, for templates
+def uploader_name(userid):
+    user = get_user(userid) if userid is not None else None
+    return user.name if user is not None else ""
+
+
+app.jinja_env.globals['uploader_name'] = uploader_name
+
+
 # flask login
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    user = session_user(id)
+    if user is None or not user.active:  # deactivated users are logged out straight away
+        return None
+    return db.session.merge(user, load=False)  # attaches the cached copy to this request without a query
@@ -0,0 +1,130 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+from app import app
+
+# Lists are split into pages with cursors instead of OFFSET, so every page is as quick to load as
+# the first. A cursor holds the sort value and id of the row at the edge of a page, and the next page
+# is the rows that sort after it ("after") or before it ("before"), which the database finds with an
+# index on (sort column, id) without reading the rows in between. Sort columns can be NULL, which
+# sqlite sorts before every other value, so the conditions below place NULLs there too.
+
+
+# one page of rows, with the cursors for the pages either side (None if there isn't one)
+class Page(object):
+    def __init__(self, items, prev_cursor, next_cursor):
+        self.items = items
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode().rstrip('=')
+
+
+# whether a value is an id the database can store (a 64 bit signed integer, json true / false don't count)
+def valid_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
+
+
+# an id from the query string (e.g. request.args.get('after', type=id_arg)), out of range ids count as missing
+def id_arg(text):
+    value = int(text)
+    if not valid_id(value):
+        raise ValueError("id out of range")
+    return value
+
+
+# the sort value and id in a cursor, or None if it can't be read (e.g. the url was edited)
+def decode_cursor(cursor, column):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        python_type = column.type.python_type
+        if value is None:
+            if not getattr(column.expression, 'nullable', True):
+                return None
+        elif python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif python_type is int:
+            if not valid_id(value):
+                return None
+        elif not isinstance(value, python_type):
+            return None
+        if not valid_id(row_id):
+            return None
+        return value, row_id
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+# the next rows of a query when reading in one direction from a cursor (or from the start)
+# NULLs sort before every other value, so reading forwards is the rows with a NULL sort value (by id)
+# followed by the rest (by sort value then id). Each part is read with its own query as "IS NULL OR
+# ..." conditions stop the database reading the (sort column, id) index in order.
+def rows_beyond(query, sort_column, id_column, cursor, reading_descending, limit):
+    parts = [('values', query.filter(sort_column.isnot(None)))]
+    if getattr(sort_column.expression, 'nullable', True):  # (not for e.g. sorting by id)
+        parts.insert(0, ('nulls', query.filter(sort_column.is_(None))))
+    if reading_descending:
+        parts = [(kind, part.order_by(sort_column.desc(), id_column.desc())) for kind, part in reversed(parts)]
+    else:
+        parts = [(kind, part.order_by(sort_column, id_column)) for kind, part in parts]
+    if cursor is not None:
+        value, row_id = cursor
+        later = id_column < row_id if reading_descending else id_column > row_id
+        if value is not None:  # the range on the sort column lets the index skip straight to the cursor
+            later = and_(sort_column <= value, or_(sort_column < value, later)) if reading_descending \
+                else and_(sort_column >= value, or_(sort_column > value, later))
+        kinds = [kind for kind, part in parts]
+        parts = parts[kinds.index('nulls' if value is None else 'values'):]
+        parts[0] = (parts[0][0], parts[0][1].filter(later))
+    rows = []
+    for kind, part in parts:
+        rows += part.limit(limit - len(rows)).all()
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+# the page of a query after (or before) a cursor, sorted by a column with the id breaking ties
+def keyset_page(query, sort_column, id_column, page_size, after=None, before=None, descending=False):
+    single = len(query.column_descriptions) == 1  # a query for one model gives models, not tuples
+    query = query.add_columns(sort_column.label('sort_key'), id_column.label('sort_id'))
+    after = decode_cursor(after, sort_column) if after else None
+    before = decode_cursor(before, sort_column) if before else None
+    backwards = before is not None
+    reading_descending = descending != backwards  # going backwards, so read the page in reverse then flip it
+    # one extra row tells us if there is another page
+    rows = rows_beyond(query, sort_column, id_column, before if backwards else after, reading_descending, page_size + 1)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    first = encode_cursor(rows[0].sort_key, rows[0].sort_id) if rows else None
+    last = encode_cursor(rows[-1].sort_key, rows[-1].sort_id) if rows else None
+    if backwards:
+        prev_cursor, next_cursor = (first if has_more else None), last
+    else:
+        prev_cursor, next_cursor = (first if after is not None else None), (last if has_more else None)
+    items = [row[0] if single else tuple(row[:-2]) for row in rows]
+    return Page(items, prev_cursor, next_cursor)
+
+
+# url of the current page with some query string arguments changed (None removes one)
+# moving to another page or changing the sort or filter starts again from the first page
+def page_url(**changes):
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(changes)
+    args = {key: value for key, value in args.items() if value not in (None, '')}
+    return url_for(request.endpoint, **dict(request.view_args or {}, **args))
+
+
+app.jinja_env.globals['page_url'] = page_url
@@ -0,0 +1,99 @@
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from app import app
+
+# Login attempts are rate limited with token buckets, one for each IP address and one for each email
+# address. A bucket holds up to "burst" tokens and refills at "per_minute" tokens a minute; every
+# attempt takes a token and is turned away (before the password is hashed) when the bucket is empty.
+# RATELIMIT_STORAGE picks where buckets are kept:
+#   "sqlite" - a small sqlite file (RATELIMIT_DB) shared by every process on the machine, so running
+#              more worker processes doesn't give an attacker more attempts
+#   "memory" - in each process (fastest, but each process has its own limits)
+
+
+# buckets kept in memory, the least recently used are dropped when there are too many
+class MemoryBuckets(object):
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> (tokens, time last updated)
+        self.lock = threading.Lock()
+
+    def take(self, key, burst, rate, now):
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (burst, now))
+            tokens, allowed = refill_and_take(tokens, updated, burst, rate, now)
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return tokens, allowed
+
+
+# buckets kept in a sqlite file, updated in a write transaction so two processes can't both take the last token
+class SqliteBuckets(object):
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()  # sqlite connections can't be shared between threads
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or getattr(self.local, 'pid', None) != os.getpid():  # new after a fork
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def take(self, key, burst, rate, now):
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+            tokens, allowed = refill_and_take(tokens, updated, burst, rate, now)
+            connection.execute("INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            if random.random() < 0.01:  # now and then forgets buckets that have been full for a day
+                connection.execute("DELETE FROM bucket WHERE updated < ?", (now - 24 * 60 * 60,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return tokens, allowed
+
+
+# tops a bucket up for the time since it was last used, then takes a token if there is one
+def refill_and_take(tokens, updated, burst, rate, now):
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, True
+    return tokens, False
+
+
+# creates the buckets chosen in the config
+def create_buckets(config):
+    if config['RATELIMIT_STORAGE'] == 'sqlite':
+        return SqliteBuckets(config['RATELIMIT_DB'])
+    return MemoryBuckets()
+
+
+buckets = create_buckets(app.config)
+
+
+# takes a token from each bucket for a login attempt
+# returns 0 if the attempt may go ahead, otherwise the seconds to wait before trying again
+def login_wait(ip_address, email_address):
+    now = time.time()
+    limits = [('login-ip:' + str(ip_address), app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_PER_MINUTE']),
+              ('login-email:' + email_address.strip().lower(), app.config['LOGIN_EMAIL_BURST'],
+               app.config['LOGIN_EMAIL_PER_MINUTE'])]
+    wait = 0
+    for key, burst, per_minute in limits:
+        tokens, allowed = buckets.take(key, burst, per_minute / 60.0, now)
+        if not allowed:
+            wait = max(wait, int(math.ceil((1 - tokens) / (per_minute / 60.0))))
+    return wait
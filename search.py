@@ -0,0 +1,145 @@
+import re
+
+from flask import request, render_template, jsonify, url_for
+from flask.cli import AppGroup
+from flask_login import current_user
+from markupsafe import Markup, escape
+from sqlalchemy import literal_column, table, column, or_, func
+
+from app import app, db
+from models import Photos, Contact, todo
+
+# Full text search over photo titles, contact messages and to do items. On sqlite each table has an
+# FTS5 index (photos_fts, contact_fts, todo_fts, made by the "full text search" migration) that
+# triggers keep up to date whenever a row is added, changed or deleted, so a search is an index lookup
+# ranked by relevance (bm25) instead of a LIKE scan over the whole table. Other databases fall back to
+# LIKE searches. Batch migrations that copy one of these tables drop its triggers, so run
+# "flask --app app search rebuild" after them (and after any change made with the triggers missing).
+
+SEARCH_PAGE_SIZE = 20
+HIGHLIGHT_START, HIGHLIGHT_END = '\x02', '\x03'  # marks matches in snippets, turned into <mark> after escaping
+
+# what can be searched: the model, its FTS5 table and the columns in it
+KINDS = {
+    'photos': {'model': Photos, 'id': Photos.photoid, 'fts': 'photos_fts', 'columns': [Photos.title]},
+    'messages': {'model': Contact, 'id': Contact.id, 'fts': 'contact_fts',
+                 'columns': [Contact.name, Contact.email, Contact.message]},
+    'todos': {'model': todo, 'id': todo.id, 'fts': 'todo_fts', 'columns': [todo.text]},
+}
+
+
+# the kinds of result the current user may see: everyone can search the gallery, logged in users
+# their own to do items and administrators the contact messages
+def allowed_kinds():
+    kinds = ['photos']
+    if not current_user.is_anonymous:
+        kinds.append('todos')
+        if current_user.is_admin():
+            kinds.append('messages')
+    return kinds
+
+
+# turns what the user typed into an FTS5 query: every word must match, as a whole word or the start
+# of one, and characters FTS5 treats as syntax (quotes, brackets, AND / OR etc.) are searched literally
+def match_query(text):
+    words = re.findall(r'\w+', text)[:10]
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+# the query restricted to the rows the current user may see
+def visible(kind, query):
+    if kind == 'photos':
+        return query.filter(Photos.enabled == True, Photos.status == 'ready')
+    if kind == 'todos':
+        return query.filter(todo.user_id == current_user.id)
+    return query
+
+
+# snippet of matching text with the matches wrapped in <mark>, safe to put in a page
+def highlight(text):
+    if text is None:
+        return Markup('')
+    return Markup(str(escape(text)).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+# one page of results, best match first, as (row, snippet) pairs, and whether there is another page
+def search(kind, text, page=1):
+    info = KINDS[kind]
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    if db.engine.dialect.name == 'sqlite':
+        query_text = match_query(text)
+        if not query_text:
+            return [], False
+        fts = table(info['fts'], column('rowid'), column('rank'))
+        snippet = func.snippet(literal_column(info['fts']), -1, HIGHLIGHT_START, HIGHLIGHT_END, '…', 12)
+        query = db.session.query(info['model'], snippet).join(fts, fts.c.rowid == info['id']) \
+            .filter(literal_column(info['fts']).op('MATCH')(query_text)).order_by(fts.c.rank)
+    else:
+        if not text.strip():
+            return [], False
+        query = db.session.query(info['model'], info['columns'][-1]) \
+            .filter(or_(*[column.contains(text, autoescape=True) for column in info['columns']])) \
+            .order_by(info['id'].desc())
+    rows = visible(kind, query).offset(offset).limit(SEARCH_PAGE_SIZE + 1).all()
+    return [(row, highlight(snippet)) for row, snippet in rows[:SEARCH_PAGE_SIZE]], len(rows) > SEARCH_PAGE_SIZE
+
+
+# json for one result
+def result_json(kind, row, snippet):
+    if kind == 'photos':
+        return {'id': row.photoid, 'title': row.title, 'url': url_for('photo_display', photo_id=row.photoid),
+                'thumb': row.thumb_url(), 'snippet': str(snippet)}
+    if kind == 'messages':
+        return {'id': row.id, 'name': row.name, 'email': row.email, 'snippet': str(snippet),
+                'dateSubmitted': row.dateSubmitted.isoformat() if row.dateSubmitted else None}
+    return {'id': row.id, 'text': row.text, 'done': bool(row.done), 'snippet': str(snippet)}
+
+
+# the kinds and page asked for in the query string
+def search_args():
+    kinds = allowed_kinds()
+    kind = request.args.get('type')
+    if kind in kinds:
+        kinds = [kind]
+    return request.args.get('q', '').strip(), kinds, max(request.args.get('page', 1, type=int), 1)
+
+
+# search page
+@app.route('/search')
+def search_page():
+    text, kinds, page = search_args()
+    results = {kind: search(kind, text, page) for kind in kinds} if text else {}
+    return render_template("search.html", title="Search", user=current_user, query=text, results=results,
+                           page=page, single=len(kinds) == 1)
+
+
+# search api: {"query", "page", "results": {"photos": {"items": [...], "next_page"}, ...}}
+@app.route('/api/search')
+def search_api():
+    text, kinds, page = search_args()
+    results = {}
+    for kind in kinds:
+        rows, has_more = search(kind, text, page) if text else ([], False)
+        results[kind] = {'items': [result_json(kind, row, snippet) for row, snippet in rows],
+                         'next_page': page + 1 if has_more else None}
+    return jsonify(query=text, page=page, results=results)
+
+
+# command line tools for the search index (flask --app app search ...)
+search_cli = AppGroup('search', help="Manage the full text search index.")
+
+
+@search_cli.command('rebuild')
+def rebuild():
+    """Rebuild the search index from the photos, contact and todo tables."""
+    if db.engine.dialect.name != 'sqlite':
+        print("Only sqlite databases have a search index")
+        return
+    for info in KINDS.values():
+        db.session.execute(db.text("INSERT INTO {0}({0}) VALUES ('rebuild')".format(info['fts'])))
+        db.session.execute(db.text("INSERT INTO {0}({0}) VALUES ('optimize')".format(info['fts'])))  # merges the index into one segment
+    db.session.commit()
+    print("Rebuilt the search index")
+
+
+app.cli.add_command(search_cli)
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.cli import AppGroup
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface, session_json_serializer
+from itsdangerous import BadSignature
+from werkzeug.datastructures import CallbackDict
+
+from app import app
+
+# Sessions are kept on the server and the cookie only holds a random session id, so flash messages
+# and the logged in user don't make the cookie grow and nothing has to be signed on each request.
+# The store only hears about a session when it changes, or when it is half way to expiring (to keep
+# it alive). SESSION_STORAGE picks where sessions are kept:
+#   "sqlite" - a sqlite file (SESSION_DB) shared by every process on the machine
+#   "memory" - in each process, the least recently used are dropped after SESSION_MAX_ENTRIES
+#              (sessions are lost on restart, and only work with a single process)
+#   "cookie" - flask's signed cookie sessions, as before
+# Sessions are stored by a hash of their id, so someone who can read the store can't use them.
+# Sessions holding nothing but a csrf token (visitors and crawlers looking at a page with a form) are
+# kept in a signed cookie instead, so they don't write to the store on every request.
+
+COOKIE_KEYS = {'csrf_token', '_fresh'}  # what a session kept in the cookie may hold (_fresh is set by flask-login)
+# Expired sessions are swept away now and then, or with "flask --app app sessions sweep".
+
+
+# a session's data, which remembers whether it has been changed
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires
+        self.loaded_userid = self.get('_user_id')  # a new session id is given out when this changes
+        self.modified = False
+
+
+# sessions kept in memory
+class MemorySessionStore(object):
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.sessions = OrderedDict()  # key -> (data, userid, expires)
+        self.lock = threading.Lock()
+
+    def load(self, key):
+        with self.lock:
+            entry = self.sessions.get(key)
+            if entry is None:
+                return None
+            self.sessions.move_to_end(key)
+            return entry[0], entry[2]
+
+    def save(self, key, data, userid, expires):
+        with self.lock:
+            self.sessions[key] = (data, userid, expires)
+            self.sessions.move_to_end(key)
+            while len(self.sessions) > self.max_entries:
+                self.sessions.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.sessions.pop(key, None)
+
+    def delete_user(self, userid):
+        with self.lock:
+            for key in [key for key, entry in self.sessions.items() if entry[1] == userid]:
+                del self.sessions[key]
+
+    def sweep(self, now):
+        with self.lock:
+            expired = [key for key, entry in self.sessions.items() if entry[2] < now]
+            for key in expired:
+                del self.sessions[key]
+        return len(expired)
+
+
+# sessions kept in a sqlite file
+class SqliteSessionStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()  # sqlite connections can't be shared between threads
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or getattr(self.local, 'pid', None) != os.getpid():  # new after a fork
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS session "
+                               "(key TEXT PRIMARY KEY, data BLOB, userid TEXT, expires REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_session_userid ON session (userid)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_session_expires ON session (expires)")
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def load(self, key):
+        return self.connection().execute("SELECT data, expires FROM session WHERE key = ?", (key,)).fetchone()
+
+    def save(self, key, data, userid, expires):
+        self.connection().execute("INSERT OR REPLACE INTO session (key, data, userid, expires) VALUES (?, ?, ?, ?)",
+                                  (key, data, userid, expires))
+
+    def delete(self, key):
+        self.connection().execute("DELETE FROM session WHERE key = ?", (key,))
+
+    def delete_user(self, userid):
+        self.connection().execute("DELETE FROM session WHERE userid = ?", (userid,))
+
+    def sweep(self, now):
+        return self.connection().execute("DELETE FROM session WHERE expires < ?", (now,)).rowcount
+
+
+# keeps sessions in a store, with just the session id in the cookie
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+        self.cookie_sessions = SecureCookieSessionInterface()  # signs sessions that are kept in the cookie
+
+    @staticmethod
+    def key(sid):
+        return hashlib.sha256(sid.encode()).hexdigest()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and '.' in sid:  # a signed session kept in the cookie (session ids never have a ".")
+            try:
+                data = self.cookie_sessions.get_signing_serializer(app).loads(
+                    sid, max_age=int(app.permanent_session_lifetime.total_seconds()))
+                return ServerSession(data, new=True)
+            except BadSignature:
+                return ServerSession(new=True)
+        if sid:
+            found = self.store.load(self.key(sid))
+            if found is not None and found[1] > time.time():
+                data, expires = found
+                return ServerSession(session_json_serializer.loads(data), sid=sid, expires=expires)
+        return ServerSession(new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:  # emptied (e.g. logged out), or never used
+            if session.sid is not None:
+                self.store.delete(self.key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        userid = session.get('_user_id')
+        if session.sid is not None and userid != session.loaded_userid:
+            # logged in or out: the old id might be known to someone else, so the session gets a new one
+            self.store.delete(self.key(session.sid))
+            session.sid = None
+        if set(session) <= COOKIE_KEYS:  # kept in the cookie, see the top of the file
+            if session.sid is not None:  # stored until now, e.g. for a flash message that has been shown
+                self.store.delete(self.key(session.sid))
+                session.sid = None
+                session.modified = True
+            if session.modified:
+                response.set_cookie(name, self.cookie_sessions.get_signing_serializer(app).dumps(dict(session)),
+                                    expires=self.get_expiration_time(app, session),
+                                    httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                    secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+            response.vary.add('Cookie')
+            return
+        # saved when changed, or half way to expiring so active users stay logged in
+        if session.sid is None or session.modified or session.expires - now < lifetime / 2:
+            if session.sid is None:
+                session.sid = secrets.token_urlsafe(32)
+            self.store.save(self.key(session.sid), session_json_serializer.dumps(dict(session)),
+                            str(userid) if userid is not None else None, now + lifetime)
+            if random.random() < 0.01:
+                self.store.sweep(now)
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+        response.vary.add('Cookie')
+
+
+# creates the session store chosen in the config (None for flask's cookie sessions)
+def create_session_store(config):
+    if config['SESSION_STORAGE'] == 'sqlite':
+        return SqliteSessionStore(config['SESSION_DB'])
+    if config['SESSION_STORAGE'] == 'memory':
+        return MemorySessionStore(config['SESSION_MAX_ENTRIES'])
+    return None
+
+
+session_store = create_session_store(app.config)
+if session_store is not None:
+    app.session_interface = ServerSessionInterface(session_store)
+
+
+# logs a user out everywhere, by deleting every session they are logged in to
+def end_user_sessions(userid):
+    if session_store is not None:
+        session_store.delete_user(str(userid))
+
+
+# command line tools for sessions (flask --app app sessions ...)
+sessions_cli = AppGroup('sessions', help="Manage stored sessions.")
+
+
+@sessions_cli.command('sweep')
+def sweep():
+    """Delete expired sessions."""
+    if session_store is None:
+        print("Sessions are stored in cookies, so there is nothing to sweep")
+        return
+    print("Deleted {} expired sessions".format(session_store.sweep(time.time())))
+
+
+app.cli.add_command(sessions_cli)
@@ -0,0 +1,248 @@
+import glob
+import os
+import shutil
+import time
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_
+
+from app import app, db, UPLOAD_FOLDER
+from models import Photos, Upload
+from images import fingerprint, strip_metadata, InvalidImage, image_extension, VARIANT_SIZES, FORMAT_EXTENSIONS
+
+# Processed photos are stored by the sha256 of their contents, in two levels of sub folders so no one
+# folder gets too big, e.g. "3f/a2/3fa2...e1.jpg". Identical uploads share the same file (and resized
+# copies), and a file is only deleted when the last Photos row using it is deleted.
+# Files can still be left behind (e.g. by a crash between saving an upload and committing its row),
+# so "flask --app app storage gc" walks the upload folder, moves files no photo or upload uses into
+# a quarantine folder (outside static, so they can't be downloaded), deletes them from there after
+# STORAGE_QUARANTINE_DAYS and reports photos whose files are missing. It reads the folder a batch at
+# a time and pauses between batches, so it can run on a live server.
+
+INCOMING_FOLDER = 'incoming'  # sub folder that uploads wait in until they have been processed
+
+
+# path (relative to the upload folder) that a file with this hash is stored at
+# always uses "/" as it is also part of the photo's url
+def blob_filename(digest, ext):
+    return "/".join([digest[:2], digest[2:4], digest + "." + ext])
+
+
+# moves a file into its content addressed location and returns the new filename
+# if the same content is already stored, the new copy is deleted instead
+def store(folder, filename, digest):
+    new_filename = blob_filename(digest, image_extension(folder, filename))
+    new_path = os.path.join(folder, new_filename)
+    if os.path.exists(new_path):
+        os.remove(os.path.join(folder, filename))
+    else:
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.replace(os.path.join(folder, filename), new_path)
+    return new_filename
+
+
+# the stored file with this hash, or None if it hasn't been stored
+def stored_filename(digest):
+    for ext in FORMAT_EXTENSIONS.values():
+        if os.path.exists(os.path.join(UPLOAD_FOLDER, blob_filename(digest, ext))):
+            return blob_filename(digest, ext)
+    return None
+
+
+# photos whose file is "<stem>.<any extension>"
+# ("/" sorts straight after ".", so this range can use the filename index)
+def photos_with_stem(stem):
+    return Photos.query.filter(Photos.filename >= stem + ".", Photos.filename < stem + "/")
+
+
+# number of photos using a file, or the same contents stored with another extension before extensions
+# came from the contents (those share the resized copies, which are named after the stem). Photos are
+# also counted by fingerprint, as a photo still being processed has its fingerprint saved before its
+# incoming copy is dropped for the stored file (see worker.process_photo), but doesn't point at it yet.
+def reference_count(filename):
+    stem = os.path.splitext(filename)[0]
+    return Photos.query.filter(or_(and_(Photos.filename >= stem + ".", Photos.filename < stem + "/"),
+                                   Photos.fingerprint == os.path.basename(stem))).count()
+
+
+# deletes a file and its resized copies (call after the photo row has been deleted)
+def release(filename):
+    if reference_count(filename):  # still used by another photo
+        return False
+    stem = os.path.splitext(os.path.join(UPLOAD_FOLDER, filename))[0]
+    for path in glob.glob(glob.escape(stem) + "*"):  # the original plus every _thumb / _medium / .webp copy
+        os.remove(path)
+    return True
+
+
+# deletes a photo row, then its files if no other photo uses them
+def delete_photo(photo):
+    filename = photo.filename
+    db.session.delete(photo)
+    db.session.commit()
+    release(filename)
+
+
+# the photo a stored file belongs to: its filename without the extension or the _thumb / _medium
+# ending, e.g. "3f/a2/3fa2...e1_thumb.webp" -> "3f/a2/3fa2...e1"
+def file_stem(filename):
+    stem = os.path.splitext(filename)[0]
+    for size in VARIANT_SIZES:
+        if stem.endswith("_" + size):
+            return stem[:-len(size) - 1]
+    return stem
+
+
+# stems of every file the database uses, from photos (with their resized copies) and unfinished uploads
+def referenced_stems():
+    stems = set()
+    for filename, in db.session.query(Photos.filename).yield_per(1000):
+        if filename:
+            stems.add(file_stem(filename))
+    for filename, in db.session.query(Upload.filename):
+        if filename:
+            stems.add(file_stem(filename))
+    return stems
+
+
+# whether a photo or upload uses the stem now (it may have been added since referenced_stems() ran),
+# including a photo still being processed whose fingerprint matches it (see reference_count())
+def still_referenced(stem):
+    if photos_with_stem(stem).with_entities(Photos.photoid).first() is not None:
+        return True
+    if Photos.query.filter_by(fingerprint=os.path.basename(stem)).with_entities(Photos.photoid).first() is not None:
+        return True
+    return db.session.query(Upload.id).filter(Upload.filename.startswith(stem + ".", autoescape=True)).first() is not None
+
+
+# every file under a folder as (path relative to it with "/" separators, modified time), in lists of
+# batch_size, reading the folders with os.scandir so a big folder is never listed all at once
+def scan_files(folder, batch_size):
+    batch = []
+    pending = ['']
+    while pending:
+        relative = pending.pop()
+        with os.scandir(os.path.join(folder, relative)) as entries:
+            for entry in entries:
+                name = relative + "/" + entry.name if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    batch.append((name, entry.stat(follow_symlinks=False).st_mtime))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+    if batch:
+        yield batch
+
+
+# moves an orphaned file into the quarantine folder, keeping its path so it can be moved back
+def quarantine(filename):
+    path = os.path.join(app.config['STORAGE_QUARANTINE_DIR'], filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    shutil.move(os.path.join(UPLOAD_FOLDER, filename), path)
+    os.utime(path)  # the time it was quarantined, so it is kept for STORAGE_QUARANTINE_DAYS from now
+
+
+# command line tools for photo storage (flask --app app storage ...)
+storage_cli = AppGroup('storage', help="Manage stored photo files.")
+
+
+@storage_cli.command('dedupe')
+def dedupe():
+    """Move photos saved before content addressed storage into it, merging identical files."""
+    moved = merged = 0
+    for photo in Photos.query.order_by(Photos.photoid):
+        if os.path.dirname(photo.filename):  # already content addressed (or still incoming)
+            continue
+        if not os.path.exists(os.path.join(UPLOAD_FOLDER, photo.filename)):
+            print("Missing file for photo {}: {}".format(photo.photoid, photo.filename))
+            continue
+        # stripped first, as new uploads are, so uploading the same photo again is stored with it
+        try:
+            strip_metadata(UPLOAD_FOLDER, photo.filename)
+        except InvalidImage:
+            print("Not an image, photo {}: {}".format(photo.photoid, photo.filename))
+            continue
+        digest = fingerprint(UPLOAD_FOLDER, photo.filename)
+        new_filename = blob_filename(digest, image_extension(UPLOAD_FOLDER, photo.filename))
+        if os.path.exists(os.path.join(UPLOAD_FOLDER, new_filename)):
+            merged += 1
+        old_filename = photo.filename
+        store(UPLOAD_FOLDER, old_filename, digest)
+        # resized copies are made again for the stored file with "flask build-variants"
+        stem = os.path.splitext(os.path.join(UPLOAD_FOLDER, old_filename))[0]
+        for path in glob.glob(glob.escape(stem) + "*"):
+            os.remove(path)
+        photo.filename = new_filename
+        photo.fingerprint = digest
+        photo.thumb = photo.medium = photo.formats = None
+        db.session.commit()
+        moved += 1
+    print("Moved {} photos ({} were duplicates)".format(moved, merged))
+
+
+
+@storage_cli.command('gc')
+@click.option('--dry-run', is_flag=True, help="Only report what would be done.")
+@click.option('--batch-size', type=int, help="Files looked at between pauses.")
+@click.option('--pause', type=float, help="Seconds to wait between batches.")
+def gc(dry_run, batch_size, pause):
+    """Quarantine files no photo uses, delete old quarantined files and report photos with missing files."""
+    batch_size = batch_size or app.config['STORAGE_GC_BATCH_SIZE']
+    pause = app.config['STORAGE_GC_PAUSE'] if pause is None else pause
+    now = time.time()
+    quarantine_dir = app.config['STORAGE_QUARANTINE_DIR']
+
+    # files no photo or upload uses (new files are left alone, their row may not be committed yet)
+    stems = referenced_stems()
+    orphans = orphan_bytes = 0
+    for batch in scan_files(UPLOAD_FOLDER, batch_size):
+        db.session.rollback()  # ends the last read, so still_referenced() sees photos added since
+        for filename, modified in batch:
+            stem = file_stem(filename)
+            if stem in stems or now - modified < app.config['STORAGE_GC_MIN_AGE'] or still_referenced(stem):
+                continue
+            orphans += 1
+            orphan_bytes += os.path.getsize(os.path.join(UPLOAD_FOLDER, filename))
+            print("Orphaned file: {}".format(filename))
+            if not dry_run:
+                quarantine(filename)
+        time.sleep(pause)
+
+    # quarantined files that have been kept long enough
+    deleted = 0
+    if os.path.isdir(quarantine_dir):
+        for batch in scan_files(quarantine_dir, batch_size):
+            for filename, modified in batch:
+                if now - modified > app.config['STORAGE_QUARANTINE_DAYS'] * 24 * 60 * 60:
+                    deleted += 1
+                    if not dry_run:
+                        os.remove(os.path.join(quarantine_dir, filename))
+            time.sleep(pause)
+
+    # photos whose files are missing (failed photos have had theirs deleted)
+    missing = 0
+    last_photoid = 0
+    while True:
+        photos = db.session.query(Photos.photoid, Photos.filename, Photos.thumb, Photos.medium) \
+            .filter(Photos.photoid > last_photoid, Photos.status != 'failed') \
+            .order_by(Photos.photoid).limit(batch_size).all()
+        db.session.rollback()
+        if not photos:
+            break
+        for photoid, *filenames in photos:
+            for filename in filenames:
+                if filename and not os.path.exists(os.path.join(UPLOAD_FOLDER, filename)):
+                    missing += 1
+                    print("Missing file for photo {}: {}".format(photoid, filename))
+        last_photoid = photos[-1][0]
+        time.sleep(pause)
+
+    print("{} {} orphaned files ({:.1f} MB), {} {} quarantined files, {} files are missing".format(
+        "Would quarantine" if dry_run else "Quarantined", orphans, orphan_bytes / 1024 / 1024,
+        "would delete" if dry_run else "deleted", deleted, missing))
+
+
+app.cli.add_command(storage_cli)
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the app reads its configuration when it is imported, so the tests get their own database first
+DATABASE = os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+os.environ['JOB_WORKER_THREADS'] = '0'
+os.environ['SESSION_STORAGE'] = 'memory'
+os.environ['RATELIMIT_STORAGE'] = 'memory'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, db  # noqa: E402
+from flask_migrate import upgrade  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        upgrade()
+    return flask_app
+
+
+@pytest.fixture
+def session(app):
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
@@ -0,0 +1,55 @@
+import base64
+import json
+from datetime import datetime
+
+from models import Contact, Photos
+from pagination import decode_cursor, encode_cursor, keyset_page
+
+
+def cursor(value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode().rstrip('=')
+
+
+def test_decode_cursor_round_trips(app):
+    assert decode_cursor(encode_cursor('b@example.com', 4), Contact.email) == ('b@example.com', 4)
+    assert decode_cursor(encode_cursor(None, 4), Contact.email) == (None, 4)
+    when = datetime(2024, 5, 1, 12, 30)
+    assert decode_cursor(encode_cursor(when, 9), Contact.dateSubmitted) == (when, 9)
+
+
+def test_decode_cursor_ignores_edited_cursors(app):
+    assert decode_cursor('not a cursor', Contact.email) is None
+    assert decode_cursor(cursor(None, 3), Photos.photoid) is None  # the id can't be NULL
+    assert decode_cursor(cursor([1], 3), Contact.email) is None
+    assert decode_cursor(cursor({'a': 1}, 3), Contact.email) is None
+    assert decode_cursor(cursor('x', 3), Photos.photoid) is None
+    assert decode_cursor(cursor(2 ** 70, 3), Photos.photoid) is None
+    assert decode_cursor(cursor('x', 1e30), Contact.email) is None
+    assert decode_cursor(cursor('x', 2 ** 63), Contact.email) is None
+    assert decode_cursor(cursor('x', True), Contact.email) is None
+
+
+def test_pages_with_null_sort_values(session):
+    names = [None, 'b', 'a', None, 'c', 'a', 'b', None, 'd', 'c', None, 'a']
+    for name in names:
+        session.add(Contact(name, None, 'message'))
+    session.flush()
+    rows = [(contact.name, contact.id) for contact in Contact.query]
+    for descending in (False, True):
+        expected = sorted(rows, key=lambda row: (row[0] is not None, row[0] or '', row[1]), reverse=descending)
+        pages = [keyset_page(Contact.query, Contact.name, Contact.id, 5, descending=descending)]
+        while pages[-1].next_cursor:
+            pages.append(keyset_page(Contact.query, Contact.name, Contact.id, 5, after=pages[-1].next_cursor,
+                                     descending=descending))
+        assert [(contact.name, contact.id) for page in pages for contact in page.items] == expected
+        # and back again from the last page
+        previous = keyset_page(Contact.query, Contact.name, Contact.id, 5, before=pages[-1].prev_cursor,
+                               descending=descending)
+        assert previous.items == pages[-2].items
+
+
+def test_edited_cursor_in_url_is_ignored(app):
+    client = app.test_client()
+    for after in (cursor(None, 3), cursor([1], 3), cursor(1, 1e30), 'W251bGwsIDNd'):
+        response = client.get('/api/v1/photos?after=' + after)
+        assert response.status_code == 200
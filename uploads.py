@@ -0,0 +1,231 @@
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from flask import request, jsonify, abort, flash
+from flask_login import current_user, login_required
+from flask_wtf.csrf import validate_csrf
+from sqlalchemy import func
+from werkzeug.utils import secure_filename
+
+from app import app, db, UPLOAD_FOLDER, allowed_file
+from models import Photos, Upload
+from worker import enqueue
+from storage import INCOMING_FOLDER
+
+# Photos are uploaded in chunks so the whole file is never held in memory, and an upload that is cut
+# off can carry on from where it stopped:
+#   POST /uploads                  {"filename", "size", "title"} -> {"id", "received", "chunk_size"}
+#   PUT  /uploads/<id>             one chunk of the file, with a "Content-Range: bytes start-end/size" header
+#   GET  /uploads/<id>             -> {"received", "size"} (where to carry on from)
+#   POST /uploads/<id>/complete    {"sha256" (optional)} -> {"photoid"}
+#   DELETE /uploads/<id>           cancels the upload
+
+# the first bytes of each image type we accept
+SIGNATURES = {
+    'jpg': [b'\xff\xd8\xff'],
+    'jpeg': [b'\xff\xd8\xff'],
+    'png': [b'\x89PNG\r\n\x1a\n'],
+    'gif': [b'GIF87a', b'GIF89a'],
+}
+
+# running sha256 of each upload this process is receiving, by upload id: (bytes hashed, hash object)
+# if the next chunk arrives at another process (or after a restart) the hash is rebuilt from the file
+_hashes = {}
+
+
+# json error response for the upload api
+def upload_error(message, status):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+
+# upload api requests are sent by javascript, so the csrf token comes in a header instead of a form field
+def check_csrf():
+    if app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except Exception:
+            abort(400)
+
+
+# bytes the user can still upload (photos they have uploaded plus uploads in progress count towards their quota)
+def quota_left(userid):
+    used = db.session.query(func.coalesce(func.sum(Photos.size), 0)) \
+        .filter(Photos.userid == userid, Photos.status != 'failed').scalar()
+    in_progress = db.session.query(func.coalesce(func.sum(Upload.size), 0)).filter(Upload.userid == userid).scalar()
+    return app.config['UPLOAD_USER_QUOTA'] - used - in_progress
+
+
+# deletes an upload and its partly received file
+def discard_upload(upload):
+    path = os.path.join(UPLOAD_FOLDER, upload.filename)
+    if os.path.exists(path):
+        os.remove(path)
+    _hashes.pop(upload.id, None)
+    db.session.delete(upload)
+
+
+# the user's upload with this id, or a 404
+def get_upload(upload_id):
+    upload = db.session.get(Upload, upload_id)
+    if upload is None or upload.userid != current_user.id:
+        abort(404)
+    return upload
+
+
+# hash of the bytes received so far for an upload
+def upload_hash(upload):
+    received, digest = _hashes.get(upload.id, (None, None))
+    if received != upload.received:  # not received by this process, so read back what is on disk
+        digest = hashlib.sha256()
+        with open(os.path.join(UPLOAD_FOLDER, upload.filename), 'rb') as file:
+            remaining = upload.received
+            while remaining:
+                chunk = file.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+    return digest
+
+
+# creates the photo for a fully uploaded file and queues it to be processed (also used by the upload form)
+def add_photo(title, filename, userid, size):
+    photo = Photos(title=title, filename=filename, userid=userid, enabled=1)  # status is pending
+    photo.size = size
+    db.session.add(photo)
+    db.session.flush()  # gives the photo its id so the job can refer to it
+    enqueue('process_photo', photo.photoid)  # checking, resizing etc. happens in the background (worker.py)
+    db.session.commit()
+    return photo
+
+
+# starts a new upload
+@app.route('/uploads', methods=['POST'])
+@login_required
+def upload_start():
+    check_csrf()
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return upload_error("Send a JSON object", 400)
+    filename = secure_filename(str(data.get('filename', '')))
+    title = str(data.get('title', '')).strip()
+    size = data.get('size')
+    if not title:
+        return upload_error("The image needs a title", 400)
+    if not allowed_file(filename):
+        return upload_error("That type of file can't be uploaded", 415)
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:  # (json true would count as 1)
+        return upload_error("The file size is missing", 400)
+    if size > app.config['UPLOAD_MAX_FILE_SIZE']:
+        return upload_error("The file is too big", 413)
+
+    # uploads the user started but never finished are thrown away
+    expired = datetime.today() - timedelta(seconds=app.config['UPLOAD_EXPIRY'])
+    for old_upload in Upload.query.filter(Upload.userid == current_user.id, Upload.dateSubmitted < expired):
+        discard_upload(old_upload)
+    if size > quota_left(current_user.id):
+        db.session.commit()
+        return upload_error("You don't have enough space left for this image", 413)
+
+    upload_id = str(uuid.uuid4())
+    upload = Upload(id=upload_id, userid=current_user.id, title=title, size=size,
+                    filename=INCOMING_FOLDER + "/" + upload_id + "." + filename.rsplit('.', 1)[1].lower())
+    os.makedirs(os.path.join(UPLOAD_FOLDER, INCOMING_FOLDER), exist_ok=True)
+    open(os.path.join(UPLOAD_FOLDER, upload.filename), 'wb').close()  # empty file the chunks are written into
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(id=upload.id, received=0, size=size, chunk_size=app.config['UPLOAD_CHUNK_SIZE']), 201
+
+
+# how much of an upload has been received, so an interrupted upload knows where to carry on from
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    upload = get_upload(upload_id)
+    return jsonify(id=upload.id, received=upload.received, size=upload.size)
+
+
+# receives one chunk, streaming it to disk and into the running hash
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    check_csrf()
+    upload = get_upload(upload_id)
+    try:  # "bytes start-end/size"
+        units, byte_range = request.headers['Content-Range'].split(' ', 1)
+        start, end = (int(number) for number in byte_range.split('/', 1)[0].split('-'))
+    except (KeyError, ValueError):
+        return upload_error("A Content-Range header is needed", 400)
+    if units != 'bytes' or start != upload.received:  # chunks must arrive in order
+        return upload_error("Expected the chunk starting at byte {}".format(upload.received), 409)
+    length = end - start + 1
+    if length <= 0 or length > app.config['UPLOAD_CHUNK_SIZE'] or end >= upload.size:
+        return upload_error("Chunk is the wrong size", 400)
+
+    digest = upload_hash(upload)
+    received = 0
+    valid = True
+    with open(os.path.join(UPLOAD_FOLDER, upload.filename), 'r+b') as file:
+        file.seek(start)
+        file.truncate()  # drops anything left from a chunk that was cut off part way
+        while received < length:
+            block = request.stream.read(min(64 * 1024, length - received))
+            if not block:
+                break
+            if start + received == 0:  # checks the start of the file looks like the image type it says it is
+                ext = upload.filename.rsplit('.', 1)[1]
+                valid = any(block.startswith(signature) for signature in SIGNATURES[ext])
+                if not valid:
+                    break
+            file.write(block)
+            digest.update(block)
+            received += len(block)
+    if not valid:
+        discard_upload(upload)
+        db.session.commit()
+        return upload_error("The file isn't a valid image", 415)
+    if received != length:  # the connection dropped, the client can check the status and resend
+        _hashes.pop(upload.id, None)
+        return upload_error("Chunk was incomplete", 400)
+
+    upload.received = end + 1
+    _hashes[upload.id] = (upload.received, digest)
+    db.session.commit()
+    return jsonify(id=upload.id, received=upload.received, size=upload.size)
+
+
+# finishes an upload and adds the photo
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def upload_complete(upload_id):
+    check_csrf()
+    upload = get_upload(upload_id)
+    if upload.received != upload.size:
+        return upload_error("Expected {} bytes but only {} have arrived".format(upload.size, upload.received), 409)
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return upload_error("Send a JSON object", 400)
+    if data.get('sha256') and data['sha256'] != upload_hash(upload).hexdigest():
+        discard_upload(upload)
+        db.session.commit()
+        return upload_error("The file was corrupted during the upload", 422)
+    title, filename, size = upload.title, upload.filename, upload.size
+    _hashes.pop(upload.id, None)
+    db.session.delete(upload)
+    photo = add_photo(title, filename, current_user.id, size)
+    flash("Image uploaded! It will appear in the photo gallery once it has been processed")
+    return jsonify(photoid=photo.photoid, status=photo.status), 201
+
+
+# cancels an upload
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def upload_cancel(upload_id):
+    check_csrf()
+    discard_upload(get_upload(upload_id))
+    db.session.commit()
+    return '', 204
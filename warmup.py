@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import click
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import text
+
+from app import app, db
+from forms import ContactForm, RegistrationForm, LoginForm, ResetPasswordForm, ResetPasswordFormAdmin, \
+    PhotoUploadForm, TodoForm, BulkActionForm
+
+# Work every process would otherwise do on its first requests is done when it starts (create_app()
+# calls warm_up()), so the first visitors after a deploy don't wait for it:
+#   templates - every template is compiled, and the compiled code is saved in TEMPLATE_CACHE_DIR so
+#               other processes (and the next deploy, for templates that haven't changed) just load it
+#   forms     - each form class is built once (wtforms sets up a form's fields the first time it is used)
+#   database  - the first connection is opened (and the sqlite pragmas run)
+# Each gunicorn worker does this as it loads the app, before it is sent any requests.
+# "flask --app app startup" starts a fresh python and times each step, failing if startup takes
+# longer than STARTUP_BUDGET seconds.
+
+FORMS = [ContactForm, RegistrationForm, LoginForm, ResetPasswordForm, ResetPasswordFormAdmin,
+         PhotoUploadForm, TodoForm, BulkActionForm]
+
+os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+
+# compiles templates, builds forms and connects to the database, returns the seconds each step took
+def warm_up():
+    timings = {}
+    start = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)  # kept in the environment's cache, so it isn't compiled again
+    timings['templates'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with app.test_request_context():
+        for form_class in FORMS:
+            form_class()
+    timings['forms'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+    timings['database'] = time.perf_counter() - start
+    return timings
+
+
+# run in a new python, so the imports are timed from scratch
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import flask, flask_sqlalchemy, flask_login, flask_wtf, sqlalchemy, PIL.Image
+libraries = time.perf_counter()
+import app
+timings = {'libraries': libraries - start, 'app modules': time.perf_counter() - libraries}
+from warmup import warm_up
+timings.update(warm_up())
+start = time.perf_counter()
+app.app.test_client().get('/')
+timings['first request'] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+@app.cli.command('startup')
+@click.option('--cold', is_flag=True, help="Empty the template cache first, as after a deploy that changed every template.")
+def startup(cold):
+    """Time each step of starting the app, failing if it is over STARTUP_BUDGET seconds."""
+    if cold:
+        app.jinja_env.bytecode_cache.clear()
+    result = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=app.root_path,
+                            stdout=subprocess.PIPE, check=True, text=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    for phase, seconds in timings.items():
+        print("{:<16}{:8.1f} ms".format(phase, seconds * 1000))
+    total = sum(timings.values())
+    print("{:<16}{:8.1f} ms (budget {:.0f} ms)".format('total', total * 1000, app.config['STARTUP_BUDGET'] * 1000))
+    if total > app.config['STARTUP_BUDGET']:
+        raise click.ClickException("Startup took longer than STARTUP_BUDGET")
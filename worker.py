@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from app import app, db, UPLOAD_FOLDER
+from models import Job, Photos
+from images import strip_metadata, build_variants, fingerprint, InvalidImage
+from storage import store, stored_filename
+from cache import cache
+
+# Background jobs are stored in the job table so they survive restarts and can be shared by every
+# process using the database. Each process starts its own small pool of threads the first time it
+# queues a job, and "flask jobs drain" can run whatever is left over from the command line.
+
+# Photos columns filled in by images.build_variants()
+VARIANT_COLUMNS = ['width', 'height', 'thumb', 'thumb_width', 'thumb_height',
+                   'medium', 'medium_width', 'medium_height', 'formats']
+
+_started = False
+_start_lock = threading.Lock()
+
+
+# decodes, checks, strips exif from, fingerprints, stores and resizes an uploaded photo
+# safe to run again after failing part way: the fingerprint is committed before the file is moved,
+# so a retry finds the stored file by its hash even though photo.filename was rolled back
+def process_photo(photo):
+    if photo.fingerprint is None:
+        try:
+            strip_metadata(UPLOAD_FOLDER, photo.filename)
+        except InvalidImage:  # retrying won't help, so the photo is marked as failed straight away
+            os.remove(os.path.join(UPLOAD_FOLDER, photo.filename))
+            photo.status = 'failed'
+            return
+        photo.fingerprint = fingerprint(UPLOAD_FOLDER, photo.filename)
+        db.session.commit()
+    if os.path.exists(os.path.join(UPLOAD_FOLDER, photo.filename)):
+        photo.filename = store(UPLOAD_FOLDER, photo.filename, photo.fingerprint)  # moves it out of the incoming folder
+    else:  # moved by an earlier attempt
+        photo.filename = stored_filename(photo.fingerprint) or photo.filename
+    # if someone has already uploaded the same image, its resized copies are shared too
+    same_image = Photos.query.filter(Photos.filename == photo.filename, Photos.photoid != photo.photoid,
+                                     Photos.thumb != None).first()
+    if same_image is not None:
+        photo.set_variants({column: getattr(same_image, column) for column in VARIANT_COLUMNS})
+    else:
+        photo.set_variants(build_variants(UPLOAD_FOLDER, photo.filename))
+    photo.status = 'ready'
+    db.session.commit()
+    cache.invalidate('gallery')  # the new photo can now be shown in the gallery
+
+
+# functions that can be queued, by name
+JOBS = {'process_photo': process_photo}
+
+
+# adds a job to the queue (committed along with the caller's session) and makes sure this process is running workers
+def enqueue(kind, photoid):
+    db.session.add(Job(kind, photoid))
+    start_workers()
+
+
+# queues jobs again that have been running for longer than JOB_LEASE_TIMEOUT, their worker thread
+# stopped with its process (e.g. gunicorn replacing workers after max_requests)
+def requeue_expired(now):
+    expired = Job.query.filter(Job.status == 'running',
+                               Job.claimed_at < now - timedelta(seconds=app.config['JOB_LEASE_TIMEOUT'])) \
+        .with_entities(Job.id).all()
+    if not expired:  # checked first so polling doesn't take sqlite's write lock
+        return
+    for job in Job.query.filter(Job.id.in_([job_id for job_id, in expired]), Job.status == 'running'):
+        job.attempts += 1  # counts as a failed attempt, so a photo that crashes its process can't loop forever
+        job.last_error = "The worker stopped while running the job"
+        if job.attempts >= app.config['JOB_MAX_ATTEMPTS']:
+            job.status = 'failed'
+            Photos.query.filter_by(photoid=job.photoid).update({'status': 'failed'})
+        else:
+            job.status = 'queued'
+            job.run_after = now
+    db.session.commit()
+
+
+# marks the next job that is due as running and returns it (or None if there is nothing to do)
+def claim_job():
+    now = datetime.today()
+    requeue_expired(now)
+    while True:
+        job = Job.query.filter(Job.status == 'queued', Job.run_after <= now) \
+            .order_by(Job.run_after).first()
+        if job is None:
+            return None
+        # only one worker can move the job from queued to running, the others try the next one
+        claimed = Job.query.filter_by(id=job.id, status='queued').update({'status': 'running', 'claimed_at': now})
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job.id)
+
+
+# runs a claimed job, putting it back in the queue with a longer wait each time it fails
+def run_job(job):
+    photo = db.session.get(Photos, job.photoid)
+    try:
+        if photo is not None:  # the photo may have been deleted while the job was waiting
+            JOBS[job.kind](photo)
+        job.status = 'done'
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.attempts += 1
+        job.last_error = traceback.format_exc()
+        if job.attempts >= app.config['JOB_MAX_ATTEMPTS']:
+            job.status = 'failed'
+            Photos.query.filter_by(photoid=job.photoid).update({'status': 'failed'})
+        else:  # waits 2, 4, 8... times the base delay before trying again
+            job.status = 'queued'
+            job.run_after = datetime.today() + timedelta(seconds=app.config['JOB_RETRY_DELAY'] * 2 ** job.attempts)
+    db.session.commit()
+
+
+# runs every job that is due, returns how many were run
+def drain():
+    count = 0
+    job = claim_job()
+    while job is not None:
+        run_job(job)
+        count += 1
+        job = claim_job()
+    return count
+
+
+# loop run by each worker thread
+def work_forever():
+    while True:
+        with app.app_context():
+            try:
+                ran = drain()
+            except Exception:  # e.g. database locked, wait and try again
+                traceback.print_exc()
+                ran = 0
+        if not ran:
+            time.sleep(app.config['JOB_POLL_INTERVAL'])
+
+
+# starts this process's worker threads (only once)
+def start_workers():
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    for number in range(app.config['JOB_WORKER_THREADS']):
+        threading.Thread(target=work_forever, name="job-worker-{}".format(number), daemon=True).start()
+
+
+# command line tools for the queue (flask --app app jobs ...)
+jobs_cli = AppGroup('jobs', help="Inspect and run background jobs.")
+
+
+@jobs_cli.command('list')
+def list_jobs():
+    """Show how many jobs are in each state and any that failed."""
+    for status, count in db.session.query(Job.status, func.count(Job.id)).group_by(Job.status):
+        print("{}: {}".format(status, count))
+    for job in Job.query.filter_by(status='failed').order_by(Job.id):
+        print("job {} ({} photo {}) failed after {} attempts:\n{}".format(
+            job.id, job.kind, job.photoid, job.attempts, job.last_error))
+
+
+@jobs_cli.command('drain')
+@click.option('--now', is_flag=True, help="Also run jobs that are waiting to be retried.")
+def drain_jobs(now):
+    """Run every queued job in this process, then exit."""
+    if now:
+        Job.query.filter_by(status='queued').update({'run_after': datetime.today()})
+        db.session.commit()
+    print("Ran {} jobs".format(drain()))
+
+
+@jobs_cli.command('work')
+def work():
+    """Run queued jobs in this process until it is stopped."""
+    threads = app.config['JOB_WORKER_THREADS'] or 1
+    for number in range(threads - 1):
+        threading.Thread(target=work_forever, name="job-worker-{}".format(number), daemon=True).start()
+    work_forever()
+
+
+@jobs_cli.command('retry')
+def retry_jobs():
+    """Queue failed jobs and jobs left running by a crashed process again."""
+    count = Job.query.filter(Job.status.in_(['failed', 'running'])) \
+        .update({'status': 'queued', 'attempts': 0, 'run_after': datetime.today()})
+    db.session.commit()
+    print("Queued {} jobs again".format(count))
+
+
+app.cli.add_command(jobs_cli)
@@ -0,0 +1,5 @@
+# Production entry point for WSGI servers, e.g. with gunicorn (settings in gunicorn.conf.py):
+#   gunicorn -c gunicorn.conf.py wsgi:application
+from app import create_app
+
+application = create_app()